@@ -1,96 +1,99 @@
+import os
 import pandas as pd
 import xarray as xr
-import os
-import numpy as np
+from anomaly_manifest import compute_anomalies_incremental
+from nc_catalog import build_catalog
+from unit_conversion import k_to_c
 
 # Functions
-def k_to_c(kelvin):
-    return kelvin - 273.15
-
-def remove_outliers_xarray(data):
-    Q1 = data.quantile(0.25)
-    Q3 = data.quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return data.where((data >= lower_bound) & (data <= upper_bound))
+def monthly_time_from_2030(data):
+    # Los archivos CMIP5 no traen un tiempo decodificable: meses desde 2030-01
+    return data.assign_coords(time=xr.cftime_range(start='2030-01', periods=data.sizes['time'], freq='MS'))
 
 # Paths and settings
 basins = ['fid_42', 'fid_48', 'fid_51', 'fid_56', 'fid_59', 'fid_61']
-normal_period = slice('1980', '2010')
-anomaly_period = slice('2030', '2060')
-summary = []
-
-for basin in basins:
-    tas_path = f'/media/duilio/8277-C610/OGGM/insumos/CR2MET25/clipped_version_v2/CR2MET_tas_{basin}.nc'
-    pr_path = f'/media/duilio/8277-C610/OGGM/insumos/CR2MET25/clipped_version_v2/CR2MET_pr_{basin}.nc'
-    data_tas = xr.open_dataset(tas_path)
-    data_pr = xr.open_dataset(pr_path)
-
-    temp_base = data_tas['temp'].mean(dim=('lat', 'lon'))
-    prcp_base = data_pr['prcp'].mean(dim=('lat', 'lon'))
-
-    # Selección correcta del histórico
-    normal_temp = temp_base.sel(time=normal_period).resample(time='A').mean()
-    normal_prcp = prcp_base.sel(time=normal_period).resample(time='A').sum()
-
-    normal_temp_mean = normal_temp.mean().item()
-    normal_prcp_mean = normal_prcp.mean().item()
-
-    directory = '/media/duilio/8277-C610/OGGM/insumos/GCM_BH5/input_cluster/original/original_clipped'
-    precipitation_files = [f for f in os.listdir(directory) if 'pr' in f and f.endswith('.nc') and basin in f]
-    temperature_files = [f for f in os.listdir(directory) if 'tas' in f and f.endswith('.nc') and basin in f]
-
-    for file_pr, file_tas in zip(precipitation_files, temperature_files):
-        # Precipitation
-        pr_anomaly = xr.open_dataset(os.path.join(directory, file_pr), decode_times=False)
-        pr_anomaly['time'] = xr.cftime_range(start='2030-01', periods=len(pr_anomaly['time']), freq='MS')
-
-        pr_data = pr_anomaly['pr'].mean(dim=('lat', 'lon'))
-        pr_data = remove_outliers_xarray(pr_data)
-        pr_data = pr_data.resample(time='A').sum()
-        pr_data = pr_data.sel(time=anomaly_period)
-
-        pr_anom = pr_data.mean().item() - normal_prcp_mean
-        pr_anom_perc = pr_anom / normal_prcp_mean
-        pr_std = pr_data.std().item()
-        pr_std_perc = pr_std / normal_prcp_mean
-
-        # Temperature
-        tas_anomaly = xr.open_dataset(os.path.join(directory, file_tas), decode_times=False)
-        tas_anomaly['time'] = xr.cftime_range(start='2030-01', periods=len(tas_anomaly['time']), freq='MS')
-
-        tas_data = tas_anomaly['tas'].mean(dim=('lat', 'lon'))
-        tas_data = remove_outliers_xarray(tas_data)
-        tas_data = tas_data.resample(time='A').mean()
-        tas_data = tas_data.sel(time=anomaly_period)
-
-        tas_anom = k_to_c(tas_data.mean().item()) - k_to_c(normal_temp_mean)
-        tas_anom_perc = tas_anom / k_to_c(normal_temp_mean)
-        tas_std = tas_data.std().item()
-        tas_std_perc = tas_std / k_to_c(normal_temp_mean)
-
-        # Save
-        summary.append({
-            'basin': basin,
-            'scenario': 'RCP8.5',
-            'model': 'CR2MET',
-            'Precipitation_Anomaly': pr_anom,
-            'Precipitation_SD': pr_std,
-            'Precipitation_Anomaly_%': pr_anom_perc * 100,
-            'Precipitation_SD_%': pr_std_perc * 100,
-            'Temperature_Anomaly': tas_anom,
-            'Temperature_SD': tas_std,
-            'Temperature_Anomaly_%': tas_anom_perc * 100,
-            'Temperature_SD_%': tas_std_perc * 100
-        })
-
-
-
-summary_df = pd.DataFrame(summary)
+normal_period = ('1980', '2010')
+anomaly_period = ('2030', '2060')
+# Cubos completos (sin clip): las medias por cuenca salen de zonal_stats con los gpkg de cuencas
+# La base son los cubos CR2MET completos (CR2MET_{var}.nc) de los que salian los
+# CR2MET_{var}_{basin}.nc de clipped_version_v2
+base_path = '/media/duilio/8277-C610/OGGM/insumos/CR2MET25'
+directory = '/media/duilio/8277-C610/OGGM/insumos/GCM_BH5/input_cluster/original'
+shapefiles_folder = '/media/duilio/8277-C610/OGGM/insumos/cuencas'
+# Matrices de pesos por grilla (zonal_stats); se construyen una vez
+weights_folder = os.path.join(shapefiles_folder, 'weights_cache')
+salida_path = '/media/duilio/8277-C610/OGGM/Thesis/tex/anomalias'
+# Series medias por cuenca ya reducidas (basin_store); None para leer siempre los NetCDF
+store_folder = '/media/duilio/8277-C610/OGGM/insumos/basin_store'
+# Catalogo de encabezados NetCDF (nc_catalog); selecciona los archivos futuros por variable
+catalog_path = '/media/duilio/8277-C610/OGGM/insumos/nc_catalog.sqlite'
+# Archivos futuros leidos por adelantado en hilos (disco externo); None para leer uno a uno
+prefetch_files = 4
+# Procesos para calcular (cuenca, miembros) en paralelo; 1 = serial
+n_workers = os.cpu_count()
+# Tope de archivos leidos a la vez entre todos los procesos; n_workers y prefetch_files se bajan
+# para caber (un solo disco USB)
+max_readers = 4
+# Filtro IQR por pixel sobre el cubo con un sketch de cuantiles de este tamano (quantile_sketch),
+# antes de la media por cuenca. Queda en None: las tablas *_CORREGIDO publicadas filtran la serie
+# media de cada cuenca, y filtrar por pixel cambia esas anomalias; 200 para activarlo
+outlier_sketch_size = None
+
+variables = {
+    'pr': {
+        'store_folder': store_folder, 'catalog': catalog_path, 'prefetch': prefetch_files,
+        'n_workers': n_workers, 'max_readers': max_readers, 'dataset': 'cmip5_cr2met',
+        'shapefiles_folder': shapefiles_folder, 'weights_folder': weights_folder,
+        'baseline_file': 'CR2MET_pr.nc', 'baseline_var': 'prcp',
+        'future_var': 'pr', 'annual': 'sum',
+        'open_kwargs': {'decode_times': False}, 'preprocess': monthly_time_from_2030,
+        'remove_outliers': True, 'outlier_sketch_size': outlier_sketch_size,
+    },
+    'tas': {
+        'store_folder': store_folder, 'catalog': catalog_path, 'prefetch': prefetch_files,
+        'n_workers': n_workers, 'max_readers': max_readers, 'dataset': 'cmip5_cr2met',
+        # k_to_c(futuro) - k_to_c(base): la anomalía es la diferencia directa;
+        # el porcentaje se calcula sobre k_to_c(base)
+        'shapefiles_folder': shapefiles_folder, 'weights_folder': weights_folder,
+        'baseline_file': 'CR2MET_tas.nc', 'baseline_var': 'temp',
+        'future_var': 'tas', 'annual': 'mean',
+        'open_kwargs': {'decode_times': False}, 'preprocess': monthly_time_from_2030,
+        'remove_outliers': True, 'outlier_sketch_size': outlier_sketch_size, 'perc_reference': k_to_c,
+    },
+}
+
+build_catalog(catalog_path, [base_path, directory])
+
+# Solo se recalculan los miembros con archivos nuevos o modificados (ver anomaly_manifest)
+results = {variable: compute_anomalies_incremental(
+               settings, basins, base_path, directory,
+               os.path.join(salida_path, f'cmip5_cr2met_anomalias_{variable}_manifest.csv'),
+               normal_period, anomaly_period, parse_name=lambda f: {})
+           for variable, settings in variables.items()}
+
+# Cada fila combina el i-ésimo archivo pr con el i-ésimo tas de la cuenca
+pr, tas = results['pr'], results['tas']
+pr['pair'] = pr.groupby('basin').cumcount()
+tas['pair'] = tas.groupby('basin').cumcount()
+paired = pr.merge(tas, on=['basin', 'pair'], suffixes=('_pr', '_tas'))
+tas_reference = k_to_c(paired['baseline_tas'])
+
+summary_df = pd.DataFrame({
+    'basin': paired['basin'],
+    'scenario': 'RCP8.5',
+    'model': 'CR2MET',
+    'Precipitation_Anomaly': paired['anomaly_pr'],
+    'Precipitation_SD': paired['future_std_pr'],
+    'Precipitation_Anomaly_%': paired['anomaly_perc_pr'] * 100,
+    'Precipitation_SD_%': paired['future_std_pr'] / paired['baseline_pr'] * 100,
+    'Temperature_Anomaly': paired['anomaly_tas'],
+    'Temperature_SD': paired['future_std_tas'],
+    'Temperature_Anomaly_%': paired['anomaly_perc_tas'] * 100,
+    'Temperature_SD_%': paired['future_std_tas'] / tas_reference * 100,
+})
 
 # Save
-summary_df.to_csv('/media/duilio/8277-C610/OGGM/Thesis/tex/anomalias/cmip5_cr2met_anomalias_broad_final_CORREGIDO.csv', index=False)
+summary_df.to_csv(os.path.join(salida_path, 'cmip5_cr2met_anomalias_broad_final_CORREGIDO.csv'), index=False)
 
 print("✅ Código corregido y archivo guardado.")
 
@@ -106,6 +109,6 @@ summary_broad = summary_df.groupby('basin').agg({
 summary_broad.columns = ['_'.join(col).strip('_') if isinstance(col, tuple) else col for col in summary_broad.columns]
 
 # Guardar tabla BROAD
-summary_broad.to_csv('/media/duilio/8277-C610/OGGM/Thesis/tex/anomalias/cmip5_cr2met_anomalias_broad_summary_CORREGIDO.csv', index=False)
+summary_broad.to_csv(os.path.join(salida_path, 'cmip5_cr2met_anomalias_broad_summary_CORREGIDO.csv'), index=False)
 
 print("✅ Versión broad corregida guardada también.")
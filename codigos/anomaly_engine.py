@@ -0,0 +1,363 @@
+#Motor unico de anomalias: todos los miembros del ensemble apilados en una dimension 'member'
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask
+from zonal_stats import basin_mean_series
+from basin_store import get_basin_series
+from unit_conversion import convert_units
+from quantile_sketch import streaming_quantiles
+from nc_catalog import query_catalog, check_consistency
+from prefetch import prefetch, read_ahead
+
+# Variable settings
+#   baseline_file: file name in baseline_path, formatted with {basin}
+#   baseline_var / future_var: variable names in the baseline and future files
+#   future_match: function(file name) -> bool, selects the future files of this variable
+#   catalog / future_query: optional nc_catalog database and column filters used instead of
+#                           future_match (default {'variable': future_var})
+#   annual: 'mean' or 'sum' of the monthly values per year
+#   future_units: units of the future files, see unit_conversion.CONVERSIONS ('auto': from the
+#                 file attrs); None leaves the values as they are
+#   perc_reference: function(baseline mean) -> denominator of the relative anomaly (default: baseline)
+#   remove_outliers: IQR filter on the monthly basin series before the annual aggregation
+#   outlier_sketch_size: optional; the IQR filter then runs per pixel on the future cube, before
+#                        the basin mean, with quartiles from a streaming sketch of this size
+#   open_kwargs / preprocess: how to open and fix each future file
+#   n_workers: optional; > 1 computes (basin, member slice) tasks in a process pool
+#   prefetch: optional number of future files read and reduced ahead on a thread pool
+#   max_readers: optional cap on the future files read at once over all workers (n_workers x
+#                prefetch); n_workers and then prefetch are lowered to fit, see reader_split
+#   store_folder / dataset: optional basin_store; the monthly basin means of every file are then
+#                           reduced once and read back from the store under the `dataset` name
+#   shapefiles_folder: optional; the baseline and future files are then unclipped and the
+#                      basin means come from zonal_stats (baseline_file without {basin})
+#   weights_folder: optional cache of the zonal_stats weight matrices (one .npz per grid)
+
+
+def remove_outliers_xarray(data, dim='time', sketch_size=None):
+    # IQR filter along `dim`, per cell (pixel or basin). sketch_size=None: exact quantiles (needs
+    # the whole `dim` in one chunk); an int: one-pass mergeable quantile sketch of that size,
+    # for chunked full-resolution cubes
+    if sketch_size is None:
+        if data.chunks is not None:
+            data = data.chunk({dim: -1})
+        quartiles = data.quantile([0.25, 0.75], dim=dim)
+    else:
+        quartiles = streaming_quantiles(data, [0.25, 0.75], dim=dim, k=sketch_size)
+    Q1 = quartiles.sel(quantile=0.25, drop=True)
+    Q3 = quartiles.sel(quantile=0.75, drop=True)
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    return data.where((data >= lower_bound) & (data <= upper_bound))
+
+
+def parse_cmip6_name(file_name):
+    # {VAR}_{PRODUCT}_{model}_ssp{NNN}_{bbc}_fid_XX.nc
+    parts = file_name.replace('.nc', '').split('_')
+    return {'model': parts[2], 'ssp': int(parts[3].replace('ssp', '')), 'bbc': parts[4]}
+
+
+def annual(series, how):
+    # Monthly -> annual by calendar year; works for numpy and cftime calendars
+    grouped = series.groupby('time.year')
+    return grouped.sum() if how == 'sum' else grouped.mean()
+
+
+def spatial_mean(data_array, shapefiles_folder=None, basins=None, weights_folder=None):
+    # Clipped file: plain mean over the basin cells; unclipped: zonal_stats weights
+    if shapefiles_folder is None:
+        return data_array.mean(dim=('lat', 'lon'))
+    return basin_mean_series(data_array, shapefiles_folder, basins, cache_folder=weights_folder)
+
+
+def basin_series(path, variable, settings, basins, open_kwargs=None, preprocess=None, dataset='baseline',
+                 cube_filter=None):
+    # Monthly basin mean series of one file: (time,) for a clipped file of basins[0],
+    # (time, basin) for an unclipped one. cube_filter: optional function applied to the
+    # (time, lat, lon) cube before the basin mean. Goes through the basin store when configured
+    shapefiles_folder = settings.get('shapefiles_folder')
+
+    def load(path):
+        if settings.get('prefetch') and dataset != 'baseline':
+            # Runs in the prefetch thread, only when the series is not in the basin store
+            read_ahead(path)
+        data = xr.open_dataset(path, chunks={}, **(open_kwargs or {}))
+        if preprocess is not None:
+            data = preprocess(data)
+        cube = data[variable] if cube_filter is None else cube_filter(data[variable])
+        return spatial_mean(cube, shapefiles_folder, basins, settings.get('weights_folder'))
+
+    if settings.get('store_folder') is None:
+        return load(path)
+    if settings.get('dataset'):
+        dataset = f"{settings['dataset']}/{dataset}"
+    series = get_basin_series(settings['store_folder'], dataset, variable, path, basins, load)
+    if shapefiles_folder is None:
+        return series.sel(basin=basins[0], drop=True)
+    return series.transpose('time', 'basin')
+
+
+def baseline_means(settings, basins, baseline_path, normal_period):
+    # Baseline (historical) mean of the annual values, one per basin
+    years = slice(int(normal_period[0]), int(normal_period[1]))
+    if settings.get('shapefiles_folder') is not None:
+        series = basin_series(os.path.join(baseline_path, settings['baseline_file']),
+                              settings['baseline_var'], settings, basins)
+        return annual(series, settings['annual']).sel(year=years).mean('year').compute()
+
+    means = []
+    for basin in basins:
+        series = basin_series(os.path.join(baseline_path, settings['baseline_file'].format(basin=basin)),
+                              settings['baseline_var'], settings, [basin])
+        means.append(float(annual(series, settings['annual']).sel(year=years).mean().compute()))
+    return xr.DataArray(means, coords={'basin': basins}, dims='basin')
+
+
+def list_future_files(future_path, basins, match, clipped=True):
+    # One listing of the folder; (basin, file) pairs in basin order.
+    # Unclipped files hold every basin, so each one is paired with all basins
+    files = sorted(f for f in os.listdir(future_path) if f.endswith('.nc') and match(f))
+    return [(basin, f) for basin in basins for f in files if not clipped or basin in f]
+
+
+def future_members(future_path, basins, settings):
+    # (basin, file) members of a variable: from the nc_catalog when settings['catalog'] is set
+    # (selected by settings['future_query'] and checked for mixed units), else by listing the folder
+    clipped = settings.get('shapefiles_folder') is None
+    if settings.get('catalog') is None:
+        return list_future_files(future_path, basins, settings['future_match'], clipped)
+
+    query = dict(settings.get('future_query', {'variable': settings['future_var']}), folder=future_path)
+    if clipped:
+        query['basin'] = list(basins)
+    table = query_catalog(settings['catalog'], **query)
+    units = settings.get('future_units')
+    check_consistency(table, None if units == 'auto' else units)
+    if clipped:
+        by_basin = table.groupby('basin')['name'].apply(list)
+        return [(basin, f) for basin in basins for f in by_basin.get(basin, [])]
+    return [(basin, f) for basin in basins for f in table['name']]
+
+
+def filters_cube(settings):
+    # The sketch IQR filter runs on the full-resolution cube, the exact one on the basin series
+    return bool(settings.get('remove_outliers')) and settings.get('outlier_sketch_size') is not None
+
+
+def future_series(path, settings, basins):
+    # Lazy monthly basin series of one future file
+    if not filters_cube(settings):
+        return basin_series(path, settings['future_var'], settings, basins,
+                            settings.get('open_kwargs'), settings.get('preprocess'), dataset='future')
+
+    sketch_size = settings['outlier_sketch_size']
+    # Filtered series are stored apart from the unfiltered ones
+    return basin_series(path, settings['future_var'], settings, basins,
+                        settings.get('open_kwargs'), settings.get('preprocess'), dataset=f'future_iqr{sketch_size}',
+                        cube_filter=lambda cube: remove_outliers_xarray(cube, sketch_size=sketch_size))
+
+
+def annual_future(series, settings):
+    # Monthly future basin series -> annual series on a 'year' axis (with a 'basin' axis too when
+    # the file is unclipped), after the outlier filter and the unit conversion
+    if settings.get('remove_outliers') and not filters_cube(settings):
+        series = remove_outliers_xarray(series)
+    series = convert_units(series, settings.get('future_units'))
+    return annual(series, settings['annual'])
+
+
+def open_future_stack(future_path, basins, settings, parse_name=parse_cmip6_name, members=None):
+    # Every matching future file (or only the given (basin, file) members) as one lazy
+    # (member, year) array with file/basin/model/ssp/bbc coords
+    clipped = settings.get('shapefiles_folder') is None
+    if members is None:
+        members = future_members(future_path, basins, settings)
+    if not members:
+        return None
+
+    member_basins = {f: [basin] if clipped else basins for basin, f in members}
+
+    if settings.get('prefetch'):
+        # Threads read the monthly series of the next `prefetch` files while the current one is
+        # reduced to its annual series here; only the annual series are kept
+        def read_monthly(f):
+            return future_series(os.path.join(future_path, f), settings, member_basins[f]).load(scheduler='synchronous')
+
+        opened = {}
+        for f, monthly in prefetch(member_basins, read_monthly, settings['prefetch']):
+            opened[f] = annual_future(monthly, settings).compute()
+    else:
+        opened = {f: annual_future(future_series(os.path.join(future_path, f), settings, member_basins[f]), settings)
+                  for f in member_basins}
+    series = [opened[f] if clipped else opened[f].sel(basin=basin, drop=True) for basin, f in members]
+
+    names = [parse_name(f) for _, f in members]
+    stack = xr.concat(series, dim='member', join='outer', coords='minimal', compat='override')
+    return stack.assign_coords(
+        member=np.arange(len(members)),
+        file=('member', [f for _, f in members]),
+        basin=('member', [basin for basin, _ in members]),
+        model=('member', [n.get('model') for n in names]),
+        ssp=('member', [n.get('ssp') for n in names]),
+        bbc=('member', [n.get('bbc') for n in names]),
+    )
+
+
+def reader_split(settings):
+    # (n_workers, prefetch per worker) with at most max_readers files read at once: every worker
+    # reads one file at a time, or `prefetch` ahead of its reduction
+    n_workers, n_ahead = settings.get('n_workers') or 1, settings.get('prefetch')
+    max_readers = settings.get('max_readers')
+    if max_readers is None:
+        return n_workers, n_ahead
+    n_workers = max(1, min(n_workers, max_readers))
+    if n_ahead:
+        n_ahead = min(n_ahead, max_readers // n_workers) or None
+    return n_workers, n_ahead
+
+
+ANOMALY_COLUMNS = ['basin', 'model', 'ssp', 'bbc', 'file', 'baseline', 'future_mean', 'future_std',
+                   'anomaly', 'anomaly_perc']
+
+
+def compute_anomalies(settings, basins, baseline_path, future_path,
+                      normal_period=('1980', '2010'), anomaly_period=('2030', '2060'),
+                      parse_name=parse_cmip6_name, members=None, baseline=None):
+    # Tidy table with one row per member: future mean/std over the anomaly period and
+    # anomaly vs the baseline, computed for every member in one reduction.
+    # members: optional (basin, file) pairs to compute instead of every matching file
+    # baseline: optional precomputed baseline_means (parallel workers)
+    n_workers, n_ahead = reader_split(settings)
+    settings = dict(settings, n_workers=n_workers, prefetch=n_ahead)
+    if baseline is None and n_workers > 1:
+        return compute_anomalies_parallel(settings, basins, baseline_path, future_path, normal_period,
+                                          anomaly_period, parse_name, members)
+    if members is not None:
+        basins = [basin for basin in basins if any(basin == b for b, _ in members)]
+    if not basins:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+    if baseline is None:
+        baseline = baseline_means(settings, basins, baseline_path, normal_period)
+    stack = open_future_stack(future_path, basins, settings, parse_name, members)
+    if stack is None:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+
+    period = stack.sel(year=slice(int(anomaly_period[0]), int(anomaly_period[1])))
+    future_mean, future_std = dask.compute(period.mean('year'), period.std('year'))
+
+    member_baseline = baseline.sel(basin=stack['basin']).values
+    reference = settings.get('perc_reference', lambda value: value)(member_baseline)
+    anomaly = future_mean.values - member_baseline
+    return pd.DataFrame({
+        'basin': stack['basin'].values,
+        'model': stack['model'].values,
+        'ssp': stack['ssp'].values,
+        'bbc': stack['bbc'].values,
+        'file': stack['file'].values,
+        'baseline': member_baseline,
+        'future_mean': future_mean.values,
+        'future_std': future_std.values,
+        'anomaly': anomaly,
+        'anomaly_perc': anomaly / reference,
+    }, columns=ANOMALY_COLUMNS)
+
+
+# === Parallel mode: (basin, member slice) tasks in a fork process pool
+# Settings hold functions (preprocess, perc_reference) that cannot be pickled, so the task
+# arguments (and the baseline means, one value per basin) are left in _task_state before forking
+# and the workers only receive task indices.
+_task_state = {}
+
+
+def _init_anomaly_worker():
+    dask.config.set(scheduler='synchronous')  # one process per core already
+
+
+def _run_anomaly_task(task_index):
+    state = _task_state
+    return compute_anomalies(state['settings'], state['basins'], state['baseline_path'], state['future_path'],
+                             state['normal_period'], state['anomaly_period'], state['parse_name'],
+                             members=state['tasks'][task_index], baseline=state['baseline'])
+
+
+def split_tasks(members, n_workers, tasks_per_worker=4):
+    # Contiguous slices of the member list: never across basins, small enough to balance the pool
+    size = max(1, -(-len(members) // (n_workers * tasks_per_worker)))
+    tasks, current = [], []
+    for basin, f in members:
+        if current and (current[-1][0] != basin or len(current) == size):
+            tasks.append(current)
+            current = []
+        current.append((basin, f))
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+def compute_anomalies_parallel(settings, basins, baseline_path, future_path,
+                               normal_period=('1980', '2010'), anomaly_period=('2030', '2060'),
+                               parse_name=parse_cmip6_name, members=None):
+    # Same table, same row order and values as the serial compute_anomalies
+    if members is None:
+        members = future_members(future_path, basins, settings)
+    basins = [basin for basin in basins if any(basin == b for b, _ in members)]
+    if not basins:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+    baseline = baseline_means(settings, basins, baseline_path, normal_period)
+    tasks = split_tasks(members, settings['n_workers'])
+
+    _task_state.update(settings=settings, basins=basins, baseline_path=baseline_path,
+                       future_path=future_path, normal_period=normal_period,
+                       anomaly_period=anomaly_period, parse_name=parse_name, tasks=tasks,
+                       baseline=baseline)
+    try:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=settings['n_workers'], mp_context=context,
+                                 initializer=_init_anomaly_worker) as pool:
+            results = list(pool.map(_run_anomaly_task, range(len(tasks))))
+    finally:
+        _task_state.clear()
+    return pd.concat(results, ignore_index=True)[ANOMALY_COLUMNS]
+
+
+# === Tables in the layout of the cmip6 *_full.csv / *_broad.csv files
+CMIP6_COLUMNS = {
+    'pr': ('Precipitation_Mean', 'Precipitation_Mean_perc', 'precipitation'),
+    'tas': ('Temperature_Mean', 'Temperature_Mean_perc', 'temperature'),
+}
+
+
+def cmip6_full_table(result, variable):
+    mean_col, perc_col, _ = CMIP6_COLUMNS[variable]
+    return pd.DataFrame({
+        'basin': [int(basin.split('_')[1]) for basin in result['basin']],
+        'model': result['model'].values,
+        'ssp_list': result['ssp'].astype(int).values,
+        'bbc_list': result['bbc'].values,
+        mean_col: result['anomaly'].values,
+        perc_col: result['anomaly_perc'].values,
+    })
+
+
+def cmip6_broad_table(full, variable):
+    mean_col, perc_col, name = CMIP6_COLUMNS[variable]
+    return full.groupby(['basin', 'ssp_list']).agg(**{
+        f'mean_{name}': (mean_col, 'mean'),
+        f'std_{name}': (mean_col, 'std'),
+        f'mean_{name}_perc': (perc_col, 'mean'),
+        f'std_{name}_perc': (perc_col, 'std'),
+    }).reset_index()
+
+
+def write_cmip6_tables(results, salida_path, full_names, broad_names):
+    # results: {'pr': tidy table, 'tas': tidy table}; *_names: {'pr': file name, 'tas': file name}
+    for variable, result in results.items():
+        full = cmip6_full_table(result, variable)
+        full.to_csv(os.path.join(salida_path, full_names[variable]), index=False)
+        cmip6_broad_table(full, variable).to_csv(os.path.join(salida_path, broad_names[variable]), index=False)
@@ -0,0 +1,120 @@
+#Figuras de anomalias por cuenca sin ventana (Agg), por lotes y en paralelo
+#
+# A figure spec is a dict: variable (key of VARIABLES), period (for the title), format (png, pdf,
+# svg, ...) and optionally csv / name / dpi. Each scenario x product group is drawn with one
+# scatter call and each scenario with one errorbar call; the specs are rendered in a fork pool.
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.lines as mlines
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+sns.set(style="whitegrid")
+
+# Variable -> CSV de anomalias, columnas de valor / error y textos del grafico
+VARIABLES = {
+    'temperatura': {'csv': 'anomalia_temperatura.csv', 'value': 'mean_temperature',
+                    'error': 'std_temperature', 'label': 'Temperatura', 'units': '°C'},
+    'precipitacion': {'csv': 'anomalia_precipitaciones.csv', 'value': 'mean_precipitation_perc',
+                      'error': 'std_precipitation_perc', 'label': 'Precipitación', 'units': '%'},
+}
+
+# Colores por escenario
+PALETTE = {
+    'SSP1-2.6': '#1f77b4',  # azul
+    'SSP5-8.5': '#ff7f0e',  # naranjo
+    'RCP8.5': '#2ca02c'     # verde
+}
+
+# Símbolos por modelo
+MARKERS = {
+    'CHELSA': 'o',
+    'CR2MET': 'X'
+}
+
+# Offsets de los puntos dentro de cada cuenca (más de cinco: repartidos uniformemente)
+OFFSETS = [-0.25, -0.10, 0, 0.10, 0.25]
+
+
+def legend_elements():
+    handles = [mlines.Line2D([], [], color=color, marker='o', linestyle='None', markersize=8, label=ssp)
+               for ssp, color in PALETTE.items()]
+    handles += [mlines.Line2D([], [], color='black', marker=marker, linestyle='None', markersize=8, label=model)
+                for model, marker in MARKERS.items()]
+    return handles
+
+
+def point_positions(basins):
+    # x of every row: position of its basin (order of appearance) + offset of its rank in the basin
+    basin_order = {basin: idx for idx, basin in enumerate(pd.unique(basins))}
+    rank = basins.groupby(basins, sort=False).cumcount().to_numpy()
+    per_basin = basins.value_counts().max()
+    offsets = np.asarray(OFFSETS if per_basin <= len(OFFSETS) else np.linspace(-0.3, 0.3, per_basin))
+    return basins.map(basin_order).to_numpy() + offsets[rank], basin_order
+
+
+def draw_anomalies(ax, data, value, error):
+    x, basin_order = point_positions(data['basin'])
+    y, yerr = data[value].to_numpy(), data[error].to_numpy()
+    ssp, model = data['ssp_list'].to_numpy(), data['Modelo'].to_numpy()
+    for scenario in pd.unique(ssp):
+        in_scenario = ssp == scenario
+        color = PALETTE.get(scenario, 'gray')
+        ax.errorbar(x[in_scenario], y[in_scenario], yerr=yerr[in_scenario], fmt='none', ecolor=color,
+                    capsize=4, elinewidth=1, zorder=2)
+        for product in pd.unique(model[in_scenario]):
+            group = in_scenario & (model == product)
+            ax.scatter(x[group], y[group], color=color, marker=MARKERS.get(product, 'o'), s=100,
+                       edgecolor='black', linewidth=0.5, zorder=3)
+    return basin_order
+
+
+def render_figure(spec, data_folder, output_dir):
+    # One figure from its spec; returns the written path
+    variable = VARIABLES[spec['variable']]
+    data = pd.read_csv(spec.get('csv') or os.path.join(data_folder, variable['csv']))
+    data['basin'] = data['basin'].astype(str)
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    basin_order = draw_anomalies(ax, data, variable['value'], variable['error'])
+
+    ax.set_title(f"Anomalía de {variable['label']} {spec['period']}", weight='bold', fontsize=16)
+    ax.set_xlabel('Cuenca', weight='bold', fontsize=14)
+    ax.set_ylabel(f"Anomalía de {variable['label']} [{variable['units']}]", weight='bold', fontsize=14)
+    ax.set_xticks(list(basin_order.values()))
+    ax.set_xticklabels(list(basin_order.keys()), fontsize=12)
+    ax.tick_params(axis='y', labelsize=12)
+    ax.grid(True, linestyle='--', alpha=0.6)
+
+    # Leyenda afuera
+    ax.legend(handles=legend_elements(), title='Escenario / Modelo', fontsize=10, title_fontsize=12,
+              loc='center left', bbox_to_anchor=(1, 0.5))
+
+    fig.tight_layout()
+    name = spec.get('name') or f"anomalia_{spec['variable']}"
+    path = os.path.join(output_dir, f"{name}.{spec.get('format', 'png')}")
+    fig.savefig(path, dpi=spec.get('dpi', 300), bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def _render(task):
+    return render_figure(*task)
+
+
+def render_figures(specs, data_folder, output_dir, n_workers=None):
+    # Every spec rendered in worker processes (serial with n_workers=1); returns the paths in order
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(spec, data_folder, output_dir) for spec in specs]
+    n_workers = min(n_workers or os.cpu_count() or 1, len(tasks))
+    if n_workers <= 1:
+        return [_render(task) for task in tasks]
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+        return list(pool.map(_render, tasks))
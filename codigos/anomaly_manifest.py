@@ -0,0 +1,102 @@
+#Recalculo incremental de anomalias: manifiesto (archivo -> filas de anomalia por miembro)
+#
+# The manifest is a CSV with the anomaly_engine rows plus the fingerprint of the future file
+# and of the basin's baseline file they came from (size, mtime, sha1) and a key of the settings.
+# On a rerun only the members whose future file, baseline or settings changed are computed;
+# the rest are taken from the manifest.
+
+import os
+import hashlib
+import pandas as pd
+from anomaly_engine import ANOMALY_COLUMNS, compute_anomalies, future_members, parse_cmip6_name
+
+FINGERPRINT_COLUMNS = ['future_size', 'future_mtime_ns', 'future_sha1',
+                       'baseline_size', 'baseline_mtime_ns', 'baseline_sha1', 'settings_key']
+
+
+def _sha1(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path, known=None):
+    # (size, mtime_ns, sha1); the file is hashed only when size/mtime differ from `known`
+    stat = os.stat(path)
+    if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known
+    return stat.st_size, stat.st_mtime_ns, _sha1(path)
+
+
+def settings_key(settings, normal_period, anomaly_period):
+    # Everything that changes the numbers of a member, except the input files
+    values = [normal_period, anomaly_period] + [settings.get(key) for key in
+                                               ('baseline_var', 'future_var', 'annual', 'future_units',
+                                                'remove_outliers', 'outlier_sketch_size',
+                                                'shapefiles_folder')]
+    for key in ('preprocess', 'perc_reference'):
+        function = settings.get(key)
+        values.append(getattr(function, '__name__', repr(function)) if function is not None else None)
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:12]
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return pd.DataFrame(columns=ANOMALY_COLUMNS + FINGERPRINT_COLUMNS)
+    return pd.read_csv(manifest_path, dtype={'future_sha1': str, 'baseline_sha1': str, 'bbc': str})
+
+
+def _known(rows, prefix):
+    if rows is None:
+        return None
+    return rows[f'{prefix}_size'], rows[f'{prefix}_mtime_ns'], rows[f'{prefix}_sha1']
+
+
+def compute_anomalies_incremental(settings, basins, baseline_path, future_path, manifest_path,
+                                  normal_period=('1980', '2010'), anomaly_period=('2030', '2060'),
+                                  parse_name=parse_cmip6_name):
+    # Same table as compute_anomalies, recomputing only the changed members; updates the manifest
+    clipped = settings.get('shapefiles_folder') is None
+    members = future_members(future_path, basins, settings)
+    key = settings_key(settings, normal_period, anomaly_period)
+    manifest = load_manifest(manifest_path)
+    previous = {(row['basin'], row['file']): row for _, row in manifest.iterrows()}
+
+    # Fingerprints, hashing only files whose size/mtime moved
+    baseline_prints, future_prints = {}, {}
+    for basin, f in members:
+        row = previous.get((basin, f))
+        baseline_file = settings['baseline_file'] if not clipped else settings['baseline_file'].format(basin=basin)
+        if basin not in baseline_prints:
+            baseline_prints[basin] = fingerprint(os.path.join(baseline_path, baseline_file), _known(row, 'baseline'))
+        if f not in future_prints:
+            future_prints[f] = fingerprint(os.path.join(future_path, f), _known(row, 'future'))
+
+    stale = []
+    for basin, f in members:
+        row = previous.get((basin, f))
+        if (row is None or row['settings_key'] != key or row['future_sha1'] != future_prints[f][2]
+                or row['baseline_sha1'] != baseline_prints[basin][2]):
+            stale.append((basin, f))
+    print(f"{len(stale)} of {len(members)} members to compute")
+
+    fresh = compute_anomalies(settings, basins, baseline_path, future_path, normal_period, anomaly_period,
+                              parse_name, members=stale)
+    fresh = {(row['basin'], row['file']): row for _, row in fresh.iterrows()}
+
+    # Rows in the order of the members; members whose file is gone are dropped from the manifest
+    rows = []
+    for basin, f in members:
+        row = fresh.get((basin, f), previous.get((basin, f))).copy()
+        row['future_size'], row['future_mtime_ns'], row['future_sha1'] = future_prints[f]
+        row['baseline_size'], row['baseline_mtime_ns'], row['baseline_sha1'] = baseline_prints[basin]
+        row['settings_key'] = key
+        rows.append(row)
+    updated = pd.DataFrame(rows, columns=ANOMALY_COLUMNS + FINGERPRINT_COLUMNS).reset_index(drop=True)
+
+    tmp_path = manifest_path + '.tmp'
+    updated.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, manifest_path)
+    return updated[ANOMALY_COLUMNS]
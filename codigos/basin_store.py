@@ -0,0 +1,153 @@
+#Almacen persistente de series medias por cuenca: (dataset, variable, basin, member, time)
+#
+# Layout of a store folder:
+#   values.f8 / times.f8: raw float64 files, series appended one after the other (read with np.memmap)
+#   index.csv: one row per series with its offset/length in the raw files, the time encoding and
+#              the size/mtime of the NetCDF it came from (a changed source is re-reduced)
+# Writers (prefetch threads, parallel anomaly workers) are serialized by a thread lock plus an
+# flock on the store's .lock file.
+
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import xarray as xr
+from xarray.coding.times import encode_cf_datetime, decode_cf_datetime
+
+TIME_UNITS = 'days since 1850-01-01'
+INDEX_COLUMNS = ['dataset', 'variable', 'basin', 'member', 'source', 'size', 'mtime_ns',
+                 'offset', 'length', 'calendar', 'use_cftime', 'units']
+
+# index.csv already parsed in this process: {store_folder: (mtime_ns, index)}
+_index_cache = {}
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def _store_lock(store_folder):
+    with _thread_lock, open(os.path.join(store_folder, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _index_path(store_folder):
+    return os.path.join(store_folder, 'index.csv')
+
+
+def load_index(store_folder):
+    path = _index_path(store_folder)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    mtime_ns = os.stat(path).st_mtime_ns
+    cached = _index_cache.get(store_folder)
+    if cached is None or cached[0] != mtime_ns:
+        index = pd.read_csv(path, dtype={'basin': str, 'member': str, 'units': str}, keep_default_na=False)
+        _index_cache[store_folder] = cached = (mtime_ns, index)
+    return cached[1].copy()
+
+
+def _save_index(store_folder, index):
+    tmp_path = _index_path(store_folder) + '.tmp'
+    index.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, _index_path(store_folder))
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_raw(store_folder, name, offset, length):
+    path = os.path.join(store_folder, name)
+    return np.memmap(path, dtype='float64', mode='r', offset=int(offset) * 8, shape=(int(length),))
+
+
+def _series_from_row(store_folder, row):
+    times = decode_cf_datetime(np.asarray(_read_raw(store_folder, 'times.f8', row['offset'], row['length'])),
+                               TIME_UNITS, row['calendar'], use_cftime=bool(row['use_cftime']))
+    values = np.asarray(_read_raw(store_folder, 'values.f8', row['offset'], row['length']))
+    attrs = {'units': row['units']} if row['units'] else {}
+    return xr.DataArray(values, coords={'time': times}, dims='time', name=row['variable'], attrs=attrs)
+
+
+def _append_series(store_folder, series):
+    # Appends one 1-D time series to the raw files; returns (offset, length, calendar, use_cftime)
+    numbers, _, calendar = encode_cf_datetime(series['time'].values, TIME_UNITS,
+                                              series['time'].dt.calendar)
+    values_path = os.path.join(store_folder, 'values.f8')
+    offset = os.path.getsize(values_path) // 8 if os.path.exists(values_path) else 0
+    with open(values_path, 'ab') as f:
+        f.write(np.ascontiguousarray(series.values, dtype='float64').tobytes())
+    with open(os.path.join(store_folder, 'times.f8'), 'ab') as f:
+        f.write(np.ascontiguousarray(numbers, dtype='float64').tobytes())
+    use_cftime = not np.issubdtype(series['time'].dtype, np.datetime64)
+    return offset, series.sizes['time'], calendar, use_cftime
+
+
+def _lookup(index, dataset, variable, basin, member, size, mtime_ns):
+    match = index[(index['dataset'] == dataset) & (index['variable'] == variable)
+                  & (index['basin'] == basin) & (index['member'] == member)]
+    if len(match) and match['size'].iloc[0] == size and match['mtime_ns'].iloc[0] == mtime_ns:
+        return match.iloc[0]
+    return None
+
+
+def get_basin_series(store_folder, dataset, variable, path, basins, loader, member=None):
+    # (basin, time) series of the NetCDF `path`, reduced once and then read from the store.
+    # loader(path) -> computed (time,) series (clipped file, one basin) or (time, basin) series.
+    # member defaults to the file name
+    os.makedirs(store_folder, exist_ok=True)
+    member = os.path.basename(path) if member is None else member
+    size, mtime_ns = _source_stamp(path)
+    with _store_lock(store_folder):
+        index = load_index(store_folder)
+    rows = [_lookup(index, dataset, variable, basin, member, size, mtime_ns) for basin in basins]
+
+    if any(row is None for row in rows):
+        # The reduction runs outside the lock; only the append and the index update are serialized
+        reduced = loader(path)
+        if 'basin' not in reduced.dims:
+            reduced = reduced.expand_dims(basin=list(basins))
+        reduced = reduced.load()
+
+        with _store_lock(store_folder):
+            index = load_index(store_folder)
+            stale = ((index['dataset'] == dataset) & (index['variable'] == variable)
+                     & index['basin'].isin(basins) & (index['member'] == member))
+            new_rows = []
+            for basin in basins:
+                series = reduced.sel(basin=basin, drop=True)
+                offset, length, calendar, use_cftime = _append_series(store_folder, series)
+                new_rows.append({'dataset': dataset, 'variable': variable, 'basin': basin, 'member': member,
+                                 'source': os.path.abspath(path), 'size': size, 'mtime_ns': mtime_ns,
+                                 'offset': offset, 'length': length, 'calendar': calendar,
+                                 'use_cftime': use_cftime, 'units': str(series.attrs.get('units', ''))})
+            index = pd.concat([index[~stale], pd.DataFrame(new_rows, columns=INDEX_COLUMNS)],
+                              ignore_index=True)
+            _save_index(store_folder, index)
+        rows = [row for _, row in pd.DataFrame(new_rows).iterrows()]
+
+    series = [_series_from_row(store_folder, row) for row in rows]
+    return xr.concat(series, dim='basin', join='outer').assign_coords(basin=list(basins))
+
+
+def compact_store(store_folder):
+    # Rewrites the raw files without the series superseded by re-reduced sources
+    index = load_index(store_folder)
+    values = [np.array(_read_raw(store_folder, 'values.f8', r['offset'], r['length'])) for _, r in index.iterrows()]
+    times = [np.array(_read_raw(store_folder, 'times.f8', r['offset'], r['length'])) for _, r in index.iterrows()]
+    lengths = index['length'].astype('int64').values
+    index['offset'] = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if len(index) else []
+
+    for name, arrays in (('values.f8', values), ('times.f8', times)):
+        tmp_path = os.path.join(store_folder, name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            for array in arrays:
+                f.write(np.ascontiguousarray(array, dtype='float64').tobytes())
+        os.replace(tmp_path, os.path.join(store_folder, name))
+    _save_index(store_folder, index)
@@ -0,0 +1,88 @@
+#Bootstrap por bloques (años) de medias de periodo, cambios y anomalias, para muchas series a la vez
+#
+# A moving-block bootstrap replicate of a period is a set of resampled years; its mean is
+# sum(count_year * value_year) / sum(count_year). So each window only needs one (n_boot x years)
+# matrix of resampling counts, drawn in seeded chunks (same result for any n_workers), and the
+# replicate means of every series are a single matrix product. The same resampled years are used
+# for all series, which keeps the correlation between models / basins. Series are processed in
+# blocks on a thread pool (the products release the GIL) to bound memory.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+
+def block_indices(rng, n, block, size):
+    # `size` moving-block resamples of positions 0..n-1 (blocks of `block` consecutive years)
+    block = max(1, min(block, n))
+    n_blocks = -(-n // block)
+    starts = rng.integers(0, n - block + 1, size=(size, n_blocks))
+    return (starts[:, :, None] + np.arange(block)).reshape(size, -1)[:, :n]
+
+
+def resample_counts(n, n_boot, block=3, seed=0, chunk=1000):
+    # (n_boot x n) times each position is drawn, in chunks with their own spawned seeds
+    chunks = [min(chunk, n_boot - start) for start in range(0, n_boot, chunk)]
+    counts = []
+    for size, sequence in zip(chunks, np.random.SeedSequence(seed).spawn(len(chunks))):
+        index = block_indices(np.random.default_rng(sequence), n, block, size)
+        rows = np.repeat(np.arange(size), index.shape[1])
+        counts.append(np.bincount(rows * n + index.ravel(), minlength=size * n).reshape(size, n))
+    return np.vstack(counts).astype('float64')
+
+
+def replicate_means(values, counts):
+    # (n_boot x series) bootstrap means of a (series x years) block; NaN years are skipped
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (counts @ np.where(valid, values, 0).T) / (counts @ valid.T)
+
+
+def _interval(replicates, ci):
+    with np.errstate(invalid='ignore'):
+        low, high = np.nanquantile(replicates, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+    return low, high
+
+
+def _years(wide, period):
+    years = wide.columns.to_numpy(dtype='int64')
+    return (years >= period[0]) & (years <= period[1])
+
+
+def bootstrap_changes(wide, reference, period, n_boot=10000, block=3, seed=0, ci=0.95, n_workers=None,
+                      max_cells=20_000_000):
+    # Per series of a (series x year) frame: means of the reference and the period, absolute change
+    # (anomaly) and percentage change, each with its bootstrap CI [lo, hi] and std.
+    # reference/period: (first_year, last_year) inclusive
+    reference_values = wide.to_numpy(dtype='float64')[:, _years(wide, reference)]
+    period_values = wide.to_numpy(dtype='float64')[:, _years(wide, period)]
+    reference_counts = resample_counts(reference_values.shape[1], n_boot, block, seed)
+    period_counts = resample_counts(period_values.shape[1], n_boot, block, seed + 1)
+
+    def run_block(rows):
+        ref = replicate_means(reference_values[rows], reference_counts)
+        fut = replicate_means(period_values[rows], period_counts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats = {'mean_ref': ref, 'mean_period': fut, 'change': fut - ref, 'change_pct': (fut - ref) / ref * 100}
+        out = {}
+        for name, replicates in stats.items():
+            out[f'{name}_lo'], out[f'{name}_hi'] = _interval(replicates, ci)
+            out[f'{name}_std'] = np.nanstd(replicates, axis=0, ddof=1)
+        return out
+
+    n_series = len(wide)
+    rows_per_block = max(1, max_cells // max(n_boot, 1))
+    blocks = [slice(start, start + rows_per_block) for start in range(0, n_series, rows_per_block)]
+    with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+        parts = list(pool.map(run_block, blocks))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_ref, mean_period = np.nanmean(reference_values, axis=1), np.nanmean(period_values, axis=1)
+    result = pd.DataFrame({'mean_ref': mean_ref, 'mean_period': mean_period, 'change': mean_period - mean_ref,
+                           'change_pct': (mean_period - mean_ref) / mean_ref * 100}, index=wide.index)
+    for column in parts[0] if parts else []:
+        result[column] = np.concatenate([part[column] for part in parts])
+    order = [f'{name}{suffix}' for name in ('mean_ref', 'mean_period', 'change', 'change_pct')
+             for suffix in ('', '_lo', '_hi', '_std')]
+    return result[order]
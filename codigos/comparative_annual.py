@@ -1,73 +1,84 @@
 import pandas as pd
 import numpy as np
-from pymannkendall import original_test
+from bootstrap import bootstrap_changes
+from runoff_store import load_runoff
+from trend_tests import mann_kendall_table
+from window_stats import annual_matrix, window_statistics, reduction, peak_water
 
-# File paths
+# Model -> series source in the runoff store (see runoff_store.RUNOFF_SOURCES)
 files = {
-    "CR2MET - SSP1-2.6": "Copia de Runoff_CR2MET_CMIP6_anual_ssp126_v2.csv",
-    "CR2MET - SSP5-8.5": "Copia de Runoff_CR2MET_CMIP6_anual_ssp585_v2.csv",
-    "CHELSA - SSP1-2.6": "Runoff_CHELSA_CMIP6_anual_v2_ssp126.csv",
-    "CHELSA - SSP5-8.5": "Runoff_CHELSA_CMIP6_anual_v2_ssp585.csv",
-    "CR2MET - CMIP5 - RCP8.5": "Runoff_CR2MET_CMIP5_anual_v2.csv",
-    "BH5 - CMIP5 - RCP8.5": "mean_of_means_bh5_cuenca_monthly_1980_2060.csv"
+    "CR2MET - SSP1-2.6": "CR2MET_CMIP6_SSP126",
+    "CR2MET - SSP5-8.5": "CR2MET_CMIP6_SSP585",
+    "CHELSA - SSP1-2.6": "CHELSA_CMIP6_SSP126",
+    "CHELSA - SSP5-8.5": "CHELSA_CMIP6_SSP585",
+    "CR2MET - CMIP5 - RCP8.5": "CR2MET_CMIP5",
+    "BH5 - CMIP5 - RCP8.5": "BH5_CMIP5"
 }
 
 # Dictionary to store annual mean
 df_annual_summary = pd.DataFrame()
+basin_frames = []
 
-for model, path in files.items():
-    df = pd.read_csv(path)
-    df["Year"] = pd.to_datetime(df.iloc[:, 0]).dt.year  # Ensure first column is year
-    
-    # Select runoff column
-    runoff_col = [col for col in df.columns if "Runoff" in col or "Mean" in col]
-    if runoff_col:
-        df["Runoff_Total"] = df[runoff_col[0]]
-    else:
-        rio_columns = [col for col in df.columns if "RIO" in col]
-        df["Runoff_Total"] = df[rio_columns].sum(axis=1)
+for model, source in files.items():
+    # Year and total runoff (RIO* columns already summed for BH5) come normalized from the store
+    df = load_runoff(columns=["COD_CUEN", "Year", "Runoff"], family="series", source=source)
+    df["Runoff_Total"] = df["Runoff"]
     
     df["Runoff_Total"] = df["Runoff_Total"].clip(lower=0)  # Replace negative values
     df_summary = df.groupby("Year")["Runoff_Total"].mean().reset_index()
     df_summary["Model"] = model
     df_annual_summary = pd.concat([df_annual_summary, df_summary], ignore_index=True)
+    basin_frames.append(df.assign(Model=model))
+
+df_basin = pd.concat(basin_frames, ignore_index=True)
 
-# Mann-Kendall Trend Test
-mk_results = []
-for model in df_annual_summary["Model"].unique():
-    series = df_annual_summary[df_annual_summary["Model"] == model]["Runoff_Total"].values
-    tau, p_value = original_test(series)[:2]
-    mk_results.append([model, tau, p_value])
+# Mann-Kendall Trend Test, all models in one call (rows in the order of `files`)
+df_mk = mann_kendall_table(df_annual_summary, "Model", "Year", "Runoff_Total")
+df_mk = df_mk.set_index("Model").loc[list(files)].reset_index()
+df_mk = df_mk[["Model", "Tau", "p", "trend", "slope"]].rename(
+    columns={"Tau": "Kendall Tau", "p": "p-value", "trend": "Trend", "slope": "Sen Slope"})
 
-df_mk = pd.DataFrame(mk_results, columns=["Model", "Kendall Tau", "p-value"])
+# Annual series as a (model x year) matrix; window stats and peak water in one pass over all models
+annual_wide = annual_matrix(df_annual_summary, "Model")
 
-# Peak Water
-df_peak = df_annual_summary.loc[df_annual_summary.groupby("Model")["Runoff_Total"].idxmax()]
+# Peak Water: maximum of the 11-year centered moving average (and of the raw series)
+df_peak = peak_water(annual_wide, window=11).loc[list(files)].reset_index()
 
 # Reduction analysis using first and last 10 years
 min_year, max_year = df_annual_summary["Year"].min(), df_annual_summary["Year"].max()
-first_10, last_10 = list(range(min_year, min_year + 10)), list(range(max_year - 9, max_year + 1))
-
-df_differences = df_annual_summary.groupby("Model").agg(
-    initial_runoff=("Runoff_Total", lambda x: x[df_annual_summary["Year"].isin(first_10)].mean()),
-    final_runoff=("Runoff_Total", lambda x: x[df_annual_summary["Year"].isin(last_10)].mean()),
-    mean_runoff=("Runoff_Total", "mean")
-).reset_index()
+windows = {"initial": (min_year, min_year + 9), "final": (max_year - 9, max_year)}
+window_stats = window_statistics(annual_wide, windows).loc[list(files)]
 
-df_differences["reduction (%)"] = (
-    (df_differences["initial_runoff"] - df_differences["final_runoff"]) / df_differences["initial_runoff"]) * 100
+df_differences = pd.DataFrame({
+    "Model": window_stats.index,
+    "initial_runoff": window_stats["mean_initial"].values,
+    "final_runoff": window_stats["mean_final"].values,
+    "mean_runoff": window_stats["mean_all"].values,
+    "initial_std": window_stats["std_initial"].values,
+    "final_std": window_stats["std_final"].values,
+})
+reduced, reduced_error = reduction(window_stats, "initial", "final")
+df_differences["reduction (%)"], df_differences["reduction_std"] = reduced.values, reduced_error.values
 
-# Standard Deviation for reduction percentage
-df_std = df_annual_summary.groupby("Model").agg(
-    initial_std=("Runoff_Total", lambda x: x[df_annual_summary["Year"].isin(first_10)].std()),
-    final_std=("Runoff_Total", lambda x: x[df_annual_summary["Year"].isin(last_10)].std())
-).reset_index()
+# Block bootstrap (3-year blocks, seeded) of the reduction: 95% interval without assuming independence
+boot = bootstrap_changes(annual_wide, windows["initial"], windows["final"], n_boot=10000, block=3, seed=0)
+boot = boot.loc[list(files)]
+df_differences["reduction_ci_low"] = -boot["change_pct_hi"].values
+df_differences["reduction_ci_high"] = -boot["change_pct_lo"].values
+df_differences["reduction_boot_std"] = boot["change_pct_std"].values
 
-df_differences = df_differences.merge(df_std, on="Model")
-df_differences["reduction_std"] = (
-    ((df_differences["initial_std"]**2 + df_differences["final_std"]**2) ** 0.5) / df_differences["initial_runoff"]) * 100
+# Same tables per model x basin
+df_basin_summary = df_basin.groupby(["Model", "COD_CUEN", "Year"], observed=True)["Runoff_Total"].mean().reset_index()
+basin_wide = annual_matrix(df_basin_summary, ["Model", "COD_CUEN"])
+basin_stats = window_statistics(basin_wide, windows)
+basin_stats["reduction (%)"], basin_stats["reduction_std"] = reduction(basin_stats, "initial", "final")
+basin_boot = bootstrap_changes(basin_wide, windows["initial"], windows["final"], n_boot=10000, block=3, seed=0)
+basin_stats["reduction_ci_low"], basin_stats["reduction_ci_high"] = -basin_boot["change_pct_hi"], -basin_boot["change_pct_lo"]
+basin_stats["reduction_boot_std"] = basin_boot["change_pct_std"]
+df_basin_results = basin_stats.join(peak_water(basin_wide, window=11)).reset_index()
 
 # Print final tables
 df_mk.to_csv("mann_kendall_results.csv", index=False)
 df_peak.to_csv("peak_water_results.csv", index=False)
 df_differences.to_csv("runoff_reduction_results.csv", index=False)
+df_basin_results.to_csv("runoff_basin_window_results.csv", index=False)
@@ -1,7 +1,7 @@
 import pandas as pd
 import numpy as np
-from pymannkendall import mk_test
 import os
+from trend_tests import mann_kendall
 
 # Directorio donde están los archivos
 data_dir = "/mnt/data/"
@@ -38,18 +38,9 @@ end_year_final = 2060
 def calculate_percentage_difference(initial_mean, final_mean):
     return ((final_mean - initial_mean) / initial_mean) * 100
 
-# Función para aplicar el test de Mann-Kendall
-def apply_mann_kendall_test(data):
-    result = mk_test(data, alpha=0.05)
-    return {
-        "tau": result.Tau,
-        "p_value": result.p,
-        "trend": result.trend,
-        "classification": "Significativa" if result.p < 0.05 else "No significativa"
-    }
-
 # DataFrame para almacenar los resultados
 results_list = []
+series = {}
 
 for cuenca, filename in cuenca_files.items():
     file_path = os.path.join(data_dir, filename)
@@ -73,8 +64,8 @@ for cuenca, filename in cuenca_files.items():
             # Diferencia porcentual
             percentage_diff = calculate_percentage_difference(initial_mean, final_mean)
 
-            # Aplicación del test de Mann-Kendall
-            kendall_results = apply_mann_kendall_test(df[model].dropna())
+            # Serie para el test de Mann-Kendall (se aplica a todas juntas al final)
+            series[(cuenca, model)] = df[model].dropna().reset_index(drop=True)
 
             # Guardar resultados
             results_list.append({
@@ -83,14 +74,17 @@ for cuenca, filename in cuenca_files.items():
                 "Inicial (m³/s)": f"{initial_mean:.2f} ± {initial_std:.2f}",
                 "Final (m³/s)": f"{final_mean:.2f} ± {final_std:.2f}",
                 "Diferencia (%)": f"{percentage_diff:.2f}%",
-                "Mann-Kendall Tau": f"{kendall_results['tau']:.2f}",
-                "p-valor": f"{kendall_results['p_value']:.4f}",
-                "Tendencia": kendall_results["trend"],
-                "Significancia": kendall_results["classification"]
             })
 
+# Test de Mann-Kendall de todas las cuencas y modelos en una llamada (series sin NaN, alineadas al inicio)
+kendall_results = mann_kendall(pd.DataFrame(series).T, alpha=0.05)
+
 # Convertir a DataFrame y guardar resultados
 results_df = pd.DataFrame(results_list)
+results_df["Mann-Kendall Tau"] = kendall_results["Tau"].map("{:.2f}".format).values
+results_df["p-valor"] = kendall_results["p"].map("{:.4f}".format).values
+results_df["Tendencia"] = kendall_results["trend"].values
+results_df["Significancia"] = np.where(kendall_results["p"] < 0.05, "Significativa", "No significativa")
 results_csv_path = os.path.join(output_dir, "runoff_analysis_results.csv")
 results_df.to_csv(results_csv_path, index=False)
 
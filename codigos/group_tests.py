@@ -0,0 +1,150 @@
+#Pruebas de hipotesis por lotes: ANOVA, Kruskal-Wallis y permutaciones para todos los estratos a la vez
+#
+# Input is a long frame (one row per observation) with a value column, a group column (ENSO
+# phase, period, ...) and any number of strata columns (dataset, basin, season, ...). Per-group
+# sums and ranks are computed for all strata with bincount / a grouped rank, so there is no loop
+# over strata. The permutation test shuffles the group labels within each stratum, in fixed
+# chunks of permutations with their own seeds (same p-values for any n_workers), in a fork pool.
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2, f as f_distribution
+
+TEST_COLUMNS = ['n', 'n_groups', 'anova_F', 'anova_p', 'eta2', 'kruskal_H', 'kruskal_p', 'epsilon2',
+                'perm_p', 'n_permutations']
+
+
+def _prepare(df, value, group, strata, groups):
+    # Rows sorted by stratum, integer codes for strata and groups; missing values dropped
+    levels = list(groups) if groups is not None else list(pd.unique(df[group].dropna()))
+    data = df[list(strata) + [group, value]].dropna(subset=[group, value])
+    group_codes = pd.Categorical(data[group], categories=levels).codes
+    data = data[group_codes >= 0].assign(_group=group_codes[group_codes >= 0])
+    data = data.assign(_stratum=data.groupby(list(strata), observed=True, sort=True, dropna=False).ngroup()
+                       if strata else 0)
+    data = data.sort_values(['_stratum', '_group'], kind='stable')
+    return data, levels
+
+
+def _group_sums(values, cell, n_cells):
+    counts = np.bincount(cell, minlength=n_cells)
+    sums = np.bincount(cell, weights=values, minlength=n_cells)
+    return counts, sums
+
+
+def _anova(values, stratum, cell, n_strata, k):
+    # One-way ANOVA F, p and eta^2 per stratum
+    counts, sums = _group_sums(values, cell, n_strata * k)
+    counts, sums = counts.reshape(n_strata, k), sums.reshape(n_strata, k)
+    n = counts.sum(axis=1)
+    total = sums.sum(axis=1)
+    squares = np.bincount(stratum, weights=values ** 2, minlength=n_strata)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (np.where(counts > 0, sums ** 2 / counts, 0)).sum(axis=1) - total ** 2 / n
+        within = squares - total ** 2 / n - between
+        df_between, df_within = k - 1, n - k
+        F = (between / df_between) / (within / df_within)
+        eta2 = between / (between + within)
+    return F, f_distribution.sf(F, df_between, df_within), eta2, counts
+
+
+def _kruskal(data, values, cell, n_strata, k, counts):
+    # Kruskal-Wallis H with tie correction (as scipy.stats.kruskal), p and epsilon^2 per stratum
+    ranks = pd.Series(values, index=data.index).groupby(data['_stratum'].values).rank(method='average').values
+    rank_sums = np.bincount(cell, weights=ranks, minlength=n_strata * k).reshape(n_strata, k)
+    n = counts.sum(axis=1)
+    ties = data.groupby(['_stratum', values], sort=False).size()
+    tie_term = np.bincount(ties.index.get_level_values(0), weights=(ties.values ** 3 - ties.values).astype('float64'),
+                           minlength=n_strata)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        H = 12.0 / (n * (n + 1)) * (rank_sums ** 2 / counts).sum(axis=1) - 3 * (n + 1)
+        H = H / (1 - tie_term / (n ** 3 - n))
+        epsilon2 = H / (n - 1)
+    return H, chi2.sf(H, k - 1), epsilon2
+
+
+# Arrays of the permutation test; left here before forking so the workers only receive chunk numbers
+_perm_state = {}
+
+
+def _between_statistic(sums, counts):
+    # sum_g S_g^2 / n_g: the only part of F that changes when the labels are permuted
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, sums ** 2 / counts, 0).sum(axis=-1)
+
+
+def _permutation_chunk(chunk):
+    # Exceedance counts per stratum for the permutations of one chunk
+    state = _perm_state
+    values, stratum, cell = state['values'], state['stratum'], state['cell']
+    n_strata, k, counts, observed = state['n_strata'], state['k'], state['counts'], state['observed']
+    size = state['chunks'][chunk]
+    rng = np.random.default_rng(state['seeds'][chunk])
+    # Rows are sorted by stratum, so sorting stratum + U[0, 0.5) shuffles within each stratum
+    order = np.argsort(stratum + 0.5 * rng.random((size, len(values))), axis=1)
+    shuffled = values[order]
+    offsets = (np.arange(size) * n_strata * k)[:, None]
+    sums = np.bincount((offsets + cell).ravel(), weights=shuffled.ravel(),
+                       minlength=size * n_strata * k).reshape(size, n_strata, k)
+    statistic = _between_statistic(sums, counts)
+    return (statistic >= observed * (1 - 1e-12)).sum(axis=0)
+
+
+def _permutation_p(values, stratum, cell, n_strata, k, counts, n_permutations, seed, n_workers,
+                   max_cells=4_000_000):
+    _, sums = _group_sums(values, cell, n_strata * k)
+    observed = _between_statistic(sums.reshape(n_strata, k), counts)
+    chunk_size = max(1, min(n_permutations, max_cells // max(len(values), 1)))
+    chunks = [chunk_size] * (n_permutations // chunk_size)
+    if n_permutations % chunk_size:
+        chunks.append(n_permutations % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    _perm_state.update(values=values, stratum=stratum.astype('float64'), cell=cell, n_strata=n_strata,
+                       k=k, counts=counts, observed=observed, chunks=chunks, seeds=seeds)
+    try:
+        n_workers = min(n_workers or os.cpu_count() or 1, len(chunks))
+        if n_workers > 1:
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+                exceed = sum(pool.map(_permutation_chunk, range(len(chunks))))
+        else:
+            exceed = sum(_permutation_chunk(chunk) for chunk in range(len(chunks)))
+    finally:
+        _perm_state.clear()
+    return (exceed + 1) / (n_permutations + 1)
+
+
+def batch_tests(df, value, group, strata=(), groups=None, n_permutations=0, seed=0, n_workers=None,
+                min_size=2):
+    # One row per stratum with ANOVA, Kruskal-Wallis and (n_permutations > 0) permutation-test results.
+    # `groups` fixes the levels compared (default: all levels present); a stratum is tested only if
+    # every level has at least min_size observations, otherwise its statistics are NaN
+    strata = list(strata)
+    data, levels = _prepare(df, value, group, strata, groups)
+    k = len(levels)
+    n_strata = int(data['_stratum'].max()) + 1 if len(data) else 0
+    values = data[value].to_numpy(dtype='float64')
+    stratum = data['_stratum'].to_numpy()
+    cell = stratum * k + data['_group'].to_numpy()
+
+    F, anova_p, eta2, counts = _anova(values, stratum, cell, n_strata, k)
+    H, kruskal_p, epsilon2 = _kruskal(data, values, cell, n_strata, k, counts)
+
+    results = (data.groupby('_stratum')[strata].first().reset_index(drop=True) if strata
+               else pd.DataFrame(index=range(n_strata)))
+    results['n'] = counts.sum(axis=1)
+    results['n_groups'] = (counts > 0).sum(axis=1)
+    results['anova_F'], results['anova_p'], results['eta2'] = F, anova_p, eta2
+    results['kruskal_H'], results['kruskal_p'], results['epsilon2'] = H, kruskal_p, epsilon2
+    results['perm_p'] = np.nan
+    results['n_permutations'] = n_permutations
+
+    testable = (counts >= min_size).all(axis=1)
+    if n_permutations > 0 and testable.any():
+        results['perm_p'] = _permutation_p(values, stratum, cell, n_strata, k, counts, n_permutations,
+                                           seed, n_workers)
+    results.loc[~testable, TEST_COLUMNS[2:9]] = np.nan
+    return results[strata + TEST_COLUMNS]
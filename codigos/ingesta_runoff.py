@@ -0,0 +1,8 @@
+from runoff_store import RUNOFF_STORE, RUNOFF_SOURCES, update_runoff_store
+
+# === Almacen Parquet de runoff (ver runoff_store.py): solo se reingieren las fuentes cuyo CSV cambio
+updated = update_runoff_store(RUNOFF_STORE, RUNOFF_SOURCES)
+if updated:
+    print(f"Reingeridas: {', '.join(f'{family}/{source}' for family, source in updated)}")
+else:
+    print(f"Almacen al dia: {RUNOFF_STORE}")
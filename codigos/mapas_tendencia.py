@@ -0,0 +1,44 @@
+# === Mapas de tendencia (Mann-Kendall / Sen por pixel) de las entradas climaticas ===
+
+import os
+from nc_catalog import build_catalog, query_catalog
+from trend_maps import compute_trend_map
+
+# === Paths
+insumos = '/media/duilio/8277-C610/OGGM/insumos'
+folders = [
+    os.path.join(insumos, 'CR2MET25/clipped_version_v2'),
+    os.path.join(insumos, 'CHELSA/clipped_version'),
+    os.path.join(insumos, 'GCM_cr2met_corregido/clipped_version'),
+    os.path.join(insumos, 'GCM_bias_CHELSA/clipped_version'),
+]
+salida_path = '/media/duilio/8277-C610/OGGM/Thesis/tex/tendencias'
+catalog_path = os.path.join(insumos, 'nc_catalog.sqlite')
+
+# Teselas lat/lon por tarea (memoria acotada por n_workers x tile) y nucleos a usar
+tile = 64
+n_workers = os.cpu_count()
+
+# Variable -> agregacion anual y unidades de origen (ver unit_conversion)
+variables = {
+    'temp': {'how': 'mean', 'units': None},
+    'prcp': {'how': 'sum', 'units': None},
+    'tas': {'how': 'mean', 'units': 'K'},
+    'pr': {'how': 'sum', 'units': 'kg m-2 s-1'},
+}
+
+os.makedirs(salida_path, exist_ok=True)
+build_catalog(catalog_path, folders)
+files = query_catalog(catalog_path, folder=folders, variable=list(variables))
+files = files[files['error'].isna()]
+
+for _, row in files.iterrows():
+    output_path = os.path.join(salida_path, f"{row['stem']}_trend.nc")
+    # Solo se recalculan los mapas cuyo archivo de entrada cambio
+    if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(row['path']):
+        continue
+    print(f"Tendencia de {row['name']}...")
+    compute_trend_map(row['path'], row['variable'], output_path, tile=tile, n_workers=n_workers,
+                      **variables[row['variable']])
+
+print(f"✅ {len(files)} mapas de tendencia en {salida_path}")
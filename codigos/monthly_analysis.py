@@ -1,32 +1,23 @@
-# File paths
+from runoff_store import load_runoff
+
+# Model -> series source in the runoff store (see runoff_store.RUNOFF_SOURCES)
 files = {
-    "CR2MET - SSP1-2.6": "/mnt/data/Runoff_CR2MET_CMIP6_anual_ssp126_v2.csv",
-    "CR2MET - SSP5-8.5": "/mnt/data/Runoff_CR2MET_CMIP6_anual_ssp585_v2.csv",
-    "CHELSA - SSP1-2.6": "/mnt/data/Runoff_CHELSA_CMIP6_anual_v2_ssp126.csv",
-    "CHELSA - SSP5-8.5": "/mnt/data/Runoff_CHELSA_CMIP6_anual_v2_ssp585.csv",
-    "CR2MET - CMIP5 - RCP8.5": "/mnt/data/Runoff_CR2MET_CMIP5_anual_v2.csv",
-    "BH5 - CMIP5 - RCP8.5": "/mnt/data/mean_of_means_bh5_cuenca_monthly_1980_2060.csv"
+    "CR2MET - SSP1-2.6": "CR2MET_CMIP6_SSP126",
+    "CR2MET - SSP5-8.5": "CR2MET_CMIP6_SSP585",
+    "CHELSA - SSP1-2.6": "CHELSA_CMIP6_SSP126",
+    "CHELSA - SSP5-8.5": "CHELSA_CMIP6_SSP585",
+    "CR2MET - CMIP5 - RCP8.5": "CR2MET_CMIP5",
+    "BH5 - CMIP5 - RCP8.5": "BH5_CMIP5"
 }
 
 # Dictionary to store annual mean and std
 df_annual_summary = pd.DataFrame()
 
 # Process each file
-for model, path in files.items():
-    df = pd.read_csv(path)
-
-    # Ensure the correct year column
-    if "Year" not in df.columns:
-        if "Fecha" in df.columns:
-            df["Year"] = pd.to_datetime(df["Fecha"]).dt.year
-
-    # Ensure the correct runoff column
-    runoff_col = [col for col in df.columns if "Runoff" in col or "Mean" in col]
-    if runoff_col:
-        df["Runoff_Total"] = df[runoff_col[0]]
-    else:  # Special case for BH5 where runoff is summed from RIO columns
-        rio_columns = [col for col in df.columns if "RIO" in col]
-        df["Runoff_Total"] = df[rio_columns].sum(axis=1)
+for model, source in files.items():
+    # Year and total runoff (RIO* columns already summed for BH5) come normalized from the store
+    df = load_runoff(columns=["Year", "Runoff"], family="series", source=source)
+    df["Runoff_Total"] = df["Runoff"]
 
     # Replace negative values with 0
     df["Runoff_Total"] = df["Runoff_Total"].clip(lower=0)
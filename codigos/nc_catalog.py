@@ -0,0 +1,165 @@
+#Catalogo indexado (SQLite) de los NetCDF de entrada: solo encabezados, un escaneo en paralelo
+#
+# One row per file: variable, units, calendar, time range, grid signature and the basin / model /
+# scenario / bias-correction method parsed from the name. Files already in the catalog with the
+# same size and mtime are not read again.
+
+import os
+import re
+import sqlite3
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import xarray as xr
+from xarray.coding.times import decode_cf_datetime
+
+COLUMNS = ['path', 'folder', 'name', 'stem', 'size', 'mtime_ns', 'variable', 'units', 'calendar',
+           'time_units', 'time_start', 'time_end', 'n_time', 'grid_signature', 'n_lat', 'n_lon',
+           'product', 'model', 'scenario', 'bbc', 'basin', 'error']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files ({', '.join(c + (' TEXT PRIMARY KEY' if c == 'path' else '') for c in COLUMNS)});
+CREATE INDEX IF NOT EXISTS files_lookup ON files (folder, variable, basin);
+CREATE INDEX IF NOT EXISTS files_member ON files (model, scenario, bbc);
+"""
+
+# Names like PP_CR2MET_ACCESS-CM2_ssp126_DQM_fid_42, pr_CSIRO_rcp85_fid_42, CR2MET_pr_fid_42
+SCENARIO_PATTERN = re.compile(r'^(ssp\d{3}|rcp\d{2})$')
+BASIN_PATTERN = re.compile(r'_(fid_\d+)$')
+
+
+def parse_file_name(stem):
+    basin = BASIN_PATTERN.search(stem)
+    tokens = (stem[:basin.start()] if basin else stem).split('_')
+    fields = {'product': None, 'model': None, 'scenario': None, 'bbc': None,
+              'basin': basin.group(1) if basin else None}
+    scenario_index = next((i for i, token in enumerate(tokens) if SCENARIO_PATTERN.match(token)), None)
+    if scenario_index is None:
+        # Observational product: {PRODUCT}_{VAR}
+        fields['product'] = tokens[0]
+        return fields
+    fields['scenario'] = tokens[scenario_index]
+    fields['model'] = tokens[scenario_index - 1] if scenario_index >= 1 else None
+    fields['product'] = tokens[1] if scenario_index >= 3 else None
+    fields['bbc'] = tokens[scenario_index + 1] if scenario_index + 1 < len(tokens) else None
+    return fields
+
+
+def _main_variable(data):
+    candidates = [name for name, var in data.data_vars.items() if {'lat', 'lon'} <= set(var.dims)]
+    return candidates[0] if candidates else None
+
+
+def _grid_signature(data):
+    digest = hashlib.sha1()
+    for coord in ('lat', 'lon'):
+        digest.update(np.ascontiguousarray(data[coord].values, dtype='float64').tobytes())
+    return digest.hexdigest()[:16]
+
+
+def read_header(path):
+    # Catalog row of one file; reads the attributes and the coordinate values only
+    stat = os.stat(path)
+    name = os.path.basename(path)
+    row = dict.fromkeys(COLUMNS)
+    row.update(path=os.path.abspath(path), folder=os.path.abspath(os.path.dirname(path)), name=name,
+               stem=os.path.splitext(name)[0], size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    row.update(parse_file_name(row['stem']))
+    try:
+        with xr.open_dataset(path, decode_times=False) as data:
+            variable = _main_variable(data)
+            row['variable'] = variable
+            if variable is not None:
+                row['units'] = data[variable].attrs.get('units')
+            if 'lat' in data.coords and 'lon' in data.coords:
+                row.update(grid_signature=_grid_signature(data), n_lat=data.sizes['lat'], n_lon=data.sizes['lon'])
+            if 'time' in data.variables:
+                time = data['time']
+                row['n_time'] = time.size
+                row['time_units'] = time.attrs.get('units')
+                row['calendar'] = time.attrs.get('calendar', 'standard')
+                if time.size and row['time_units']:
+                    try:
+                        ends = decode_cf_datetime(time.values[[0, -1]], row['time_units'], row['calendar'],
+                                                  use_cftime=True)
+                        row['time_start'], row['time_end'] = (t.isoformat() for t in ends)
+                    except (ValueError, TypeError, OverflowError):
+                        pass  # e.g. 'months since' on a standard calendar: fixed by the script's preprocess
+    except Exception as error:  # an unreadable header is recorded, not fatal
+        row['error'] = f"{type(error).__name__}: {error}"
+    return row
+
+
+def _connect(catalog_path):
+    # several anomaly scripts may update the catalog at once (pipeline.py): wait for the lock
+    connection = sqlite3.connect(catalog_path, timeout=60)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def build_catalog(catalog_path, folders, n_workers=None, pattern='.nc'):
+    # Scans the folders (not recursive) and (re)reads the headers of new or changed files in a
+    # process pool; files no longer on disk are removed. Returns the catalog as a DataFrame
+    paths = sorted(os.path.abspath(os.path.join(folder, f)) for folder in folders
+                   for f in os.listdir(folder) if f.endswith(pattern))
+    connection = _connect(catalog_path)
+    with connection:
+        known = {path: (size, mtime_ns) for path, size, mtime_ns
+                 in connection.execute('SELECT path, size, mtime_ns FROM files')}
+        changed = []
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(path)
+
+        if changed:
+            n_workers = n_workers or os.cpu_count()
+            if n_workers > 1 and len(changed) > 1:
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as pool:
+                    rows = list(pool.map(read_header, changed, chunksize=8))
+            else:
+                rows = [read_header(path) for path in changed]
+            connection.executemany(
+                f"INSERT OR REPLACE INTO files VALUES ({', '.join('?' * len(COLUMNS))})",
+                [[row[c] for c in COLUMNS] for row in rows])
+
+        scanned_folders, on_disk = [os.path.abspath(folder) for folder in folders], set(paths)
+        gone = [(path,) for path in known if path not in on_disk and os.path.dirname(path) in scanned_folders]
+        connection.executemany('DELETE FROM files WHERE path = ?', gone)
+    connection.close()
+    return query_catalog(catalog_path)
+
+
+def query_catalog(catalog_path, **filters):
+    # Rows matching column=value (or column=[values]) filters, ordered by folder/basin/name
+    clauses, parameters = [], []
+    for column, value in filters.items():
+        if column not in COLUMNS:
+            raise ValueError(f"Unknown catalog column '{column}'")
+        if column == 'folder':
+            value = [os.path.abspath(v) for v in value] if isinstance(value, (list, tuple)) else os.path.abspath(value)
+        values = list(value) if isinstance(value, (list, tuple)) else [value]
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        parameters.extend(values)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    connection = _connect(catalog_path)
+    table = pd.read_sql_query(f'SELECT * FROM files{where} ORDER BY folder, basin, name', connection,
+                              params=parameters)
+    connection.close()
+    return table
+
+
+def check_consistency(table, expected_units=None):
+    # ValueError if the selection mixes units or has unreadable headers, before any data is read
+    errors = table[table['error'].notna()]
+    if len(errors):
+        raise ValueError(f"Unreadable NetCDF headers: {', '.join(errors['name'])}")
+    units = set(table['units'].dropna())
+    if len(units) > 1:
+        raise ValueError(f"Mixed units in the selection: {sorted(units)}")
+    if expected_units is not None and units and units != {expected_units}:
+        raise ValueError(f"Files are in {units.pop()}, settings say {expected_units}")
+    return table
@@ -0,0 +1,115 @@
+#Clip en paralelo de muchos NetCDF: un trabajo por archivo (todas las cuencas) en un pool de procesos
+
+import os
+import time
+import resource
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import xarray as xr
+import pandas as pd
+from clip_engine import clip_netcdf_all_basins, list_basin_files
+
+
+def estimate_job_mb(netcdf_path, variable=None, open_kwargs=None):
+    # Decoded size of the source cube and its number of time steps, from the header only
+    with xr.open_dataset(netcdf_path, **(open_kwargs or {})) as dataset:
+        data = dataset[variable] if variable is not None else dataset
+        return data.nbytes / 1e6, dataset.sizes.get('time', 0)
+
+
+def plan_jobs(netcdf_files, shapefiles_folder, job_budget_mb=None, variable=None, open_kwargs=None,
+              chunk_time=None):
+    # One job per file, all basins from one read. A file whose cube (or chunk_time chunk) does not
+    # fit in job_budget_mb is streamed in time chunks that fit, which bounds the job's memory
+    # (a file x basin split would still read every time step of the basin window at once)
+    basin_files = list_basin_files(shapefiles_folder)
+    jobs = []
+    for netcdf_path, name_output in netcdf_files:
+        job_chunk_time = chunk_time
+        try:
+            size_mb, n_time = estimate_job_mb(netcdf_path, variable, open_kwargs)
+        except Exception:
+            # Unreadable header: keep it as a job so the worker reports the error
+            size_mb, n_time = 0, 0
+        if job_budget_mb is not None and n_time:
+            step_mb = size_mb / n_time
+            if step_mb * min(job_chunk_time or n_time, n_time) > job_budget_mb:
+                job_chunk_time = max(1, int(job_budget_mb // step_mb))
+        jobs.append((netcdf_path, name_output, basin_files, job_chunk_time))
+    return jobs
+
+
+def _run_job(netcdf_path, name_output, basin_files, chunk_time, shapefiles_folder, output_folder, clip_kwargs):
+    start = time.time()
+    try:
+        clip_netcdf_all_basins(netcdf_path, shapefiles_folder, output_folder, name_output,
+                               basin_files=basin_files, **dict(clip_kwargs, chunk_time=chunk_time))
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return {
+        'netcdf': netcdf_path,
+        'basins': ','.join(b[:-5] for b in basin_files),
+        'chunk_time': chunk_time,
+        'status': 'ok' if error is None else 'failed',
+        'seconds': time.time() - start,
+        # peak resident size of the worker process so far (Linux reports KB)
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'error': error,
+    }
+
+
+def clip_batch(netcdf_files, shapefiles_folder, output_folder, n_workers=None,
+               memory_budget_mb=None, worker_overhead_mb=500, min_job_mb=500, **clip_kwargs):
+    # netcdf_files: list of (netcdf_path, name_output)
+    # memory_budget_mb: total for the whole batch. The worker count is capped so that every worker
+    # gets worker_overhead_mb (resident size of the libraries in one process) plus at least
+    # min_job_mb of data; each worker's share minus the overhead sets the chunking of its jobs.
+    # It is a soft limit: nothing is killed, the peak RSS of the workers is reported per job and
+    # jobs whose worker went over its share are listed at the end
+    n_workers = max(1, min(n_workers or os.cpu_count(), len(netcdf_files) or 1))
+    worker_mb = job_budget_mb = None
+    if memory_budget_mb is not None:
+        n_workers = max(1, min(n_workers, int(memory_budget_mb // (worker_overhead_mb + min_job_mb))))
+        worker_mb = memory_budget_mb / n_workers
+        job_budget_mb = max(worker_mb - worker_overhead_mb, min_job_mb)
+    jobs = plan_jobs(netcdf_files, shapefiles_folder, job_budget_mb,
+                     clip_kwargs.get('variable'), clip_kwargs.get('open_kwargs'),
+                     clip_kwargs.get('chunk_time'))
+    print(f"{len(jobs)} jobs on {n_workers} workers"
+          + (f" ({worker_mb:.0f} MB each)" if worker_mb is not None else ""))
+
+    # fork: the drivers are plain scripts without a __main__ guard
+    context = multiprocessing.get_context('fork')
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=context) as executor:
+        futures = {
+            executor.submit(_run_job, netcdf_path, name_output, basin_files, job_chunk_time,
+                            shapefiles_folder, output_folder, clip_kwargs): position
+            for position, (netcdf_path, name_output, basin_files, job_chunk_time) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            position = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                # The worker itself died (e.g. killed by the OS); the pool reports it per job
+                netcdf_path, _, basin_files, job_chunk_time = jobs[position]
+                result = {'netcdf': netcdf_path, 'basins': ','.join(b[:-5] for b in basin_files),
+                          'chunk_time': job_chunk_time, 'status': 'failed', 'seconds': None,
+                          'peak_rss_mb': None, 'error': traceback.format_exc()}
+            print(f"[{result['status']}] {result['netcdf']} ({result['basins']})")
+            # Progress is printed as jobs finish; the report keeps the planned file order
+            results[position] = result
+
+    report = pd.DataFrame(results)
+    failed = report[report['status'] == 'failed']
+    print(f"Finished: {len(report) - len(failed)} ok, {len(failed)} failed")
+    for _, row in failed.iterrows():
+        print(f"--- {row['netcdf']} ({row['basins']})\n{row['error']}")
+    if worker_mb is not None:
+        for _, row in report[pd.to_numeric(report['peak_rss_mb']) > worker_mb].iterrows():
+            print(f"Warning: worker of {row['netcdf']} peaked at {row['peak_rss_mb']:.0f} MB "
+                  f"(share {worker_mb:.0f} MB); raise worker_overhead_mb or lower n_workers")
+    return report
@@ -0,0 +1,211 @@
+#Motor de clip de una sola pasada: todas las cuencas desde una lectura del NetCDF
+
+import os
+import numpy as np
+import xarray as xr
+import dask
+import rioxarray  # noqa: F401 (registra el accessor .rio)
+import rasterio.windows
+from rasterio import features
+from mask_cache import load_or_build_masks
+from output_encoding import write_output, output_path_for
+
+
+def list_basin_files(shapefiles_folder):
+    # Same selection as clip_netcdf_for_all_shapefiles: every .gpkg in the folder
+    return sorted(f for f in os.listdir(shapefiles_folder) if f.endswith(".gpkg"))
+
+
+def basin_output_path(output_folder, name_output, shapefile_name):
+    # Same naming as the per-basin scripts: {name_output}_{fid_XX}.nc
+    return os.path.join(output_folder, f"{name_output}_{shapefile_name[:-5]}.nc")
+
+
+def read_basin_geometries(shapefiles_folder, basin_files):
+    # The bbox overlay of the old path is the basin itself, so the union is enough
+    import geopandas as gpd  # not needed when the masks come from mask_cache
+
+    geometries = []
+    for shapefile_name in basin_files:
+        shapefile = gpd.read_file(os.path.join(shapefiles_folder, shapefile_name))
+        geometries.append(shapefile.geometry.unary_union)
+    return geometries
+
+
+def rasterize_basins(data, geometries, all_touched=False):
+    # Label grids on the NetCDF grid (see labels_from_masks), same rasterization as rio.clip
+    shape = (int(data.rio.height), int(data.rio.width))
+    transform = data.rio.transform(recalc=True)
+    masks = [features.geometry_mask([geometry], out_shape=shape, transform=transform, invert=True,
+                                    all_touched=all_touched)
+             for geometry in geometries]
+    return labels_from_masks(masks)
+
+
+def labels_from_masks(masks):
+    # (layer, lat, lon) integer label grids: 0 outside, i + 1 inside basin i. A grid holds one
+    # basin per cell, so a basin that overlaps the ones already placed (nested gpkgs,
+    # all_touched=True) goes to the next grid; basins that do not overlap share one
+    layers = []
+    for i, mask in enumerate(masks):
+        mask = np.asarray(mask, dtype=bool)
+        layer = next((layer for layer in layers if not layer[mask].any()), None)
+        if layer is None:
+            layer = np.zeros(mask.shape, dtype="int32")
+            layers.append(layer)
+        layer[mask] = i + 1
+    return np.stack(layers)
+
+
+def _clip_array_to_mask(data_array, mask, window):
+    # Same steps as rio.clip: mask, crop to the data window, restore nodata and dtype
+    y_dim, x_dim = data_array.rio.y_dim, data_array.rio.x_dim
+    clipped = data_array.where(xr.DataArray(mask, dims=(y_dim, x_dim)))
+    clipped = clipped.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim, inplace=True)
+    clipped = clipped.rio.isel_window(window)
+    nodata = data_array.rio.nodata
+    if nodata is not None and not np.isnan(nodata):
+        clipped = clipped.fillna(nodata)
+    clipped = clipped.astype(data_array.dtype)
+    clipped.attrs = data_array.attrs.copy()
+    clipped.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim, inplace=True)
+    clipped.rio.write_crs(data_array.rio.crs, inplace=True)
+    clipped.rio.write_coordinate_system(inplace=True)
+    clipped.rio.write_transform(inplace=True)
+    clipped.encoding = data_array.encoding.copy()
+    return clipped
+
+
+def clip_to_label(data, labels, label):
+    # Clip a DataArray or Dataset to the cells of one basin of the label grids
+    mask = (labels == label).any(axis=0)
+    if not mask.any():
+        raise ValueError(f"Basin {label} does not cover any cell of the grid")
+    window = rasterio.windows.get_data_window(np.ma.masked_array(mask, ~mask))
+
+    if isinstance(data, xr.DataArray):
+        return _clip_array_to_mask(data, mask, window)
+
+    x_dim, y_dim = data.rio.x_dim, data.rio.y_dim
+    clipped = xr.Dataset(attrs=data.attrs)
+    for var in data.data_vars:
+        if x_dim in data[var].dims and y_dim in data[var].dims:
+            data_array = data[var].rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim)
+            clipped[var] = _clip_array_to_mask(data_array, mask, window)
+        else:
+            clipped[var] = data[var].copy()
+    return clipped.rio.set_spatial_dims(x_dim=x_dim, y_dim=y_dim, inplace=True)
+
+
+def open_for_clip(netcdf_path, variable=None, preprocess=None, open_kwargs=None, chunk_time=None):
+    # Open the source the way the clip scripts do: lon/lat spatial dims and EPSG:4326
+    # chunk_time opens it lazily with dask, chunk_time time steps per chunk
+    open_kwargs = dict(open_kwargs or {})
+    if chunk_time is not None:
+        open_kwargs['chunks'] = {'time': chunk_time}
+    dataset = xr.open_dataset(netcdf_path, **open_kwargs)
+    if preprocess is not None:
+        dataset = preprocess(dataset)
+    if variable is not None:
+        dataset = dataset[variable]
+    dataset = dataset.rio.set_spatial_dims("lon", "lat", inplace=True)
+    dataset = dataset.rio.write_crs('EPSG:4326')
+    return dataset
+
+
+def bounds_to_window(dataset, bounds):
+    # Integer index window of the grid cells that intersect (minx, miny, maxx, maxy)
+    minx, miny, maxx, maxy = bounds
+    window = {}
+    for dim, low, high in (("lat", miny, maxy), ("lon", minx, maxx)):
+        coord = dataset[dim].values
+        half_cell = abs(coord[1] - coord[0]) / 2 if coord.size > 1 else 0
+        inside = np.nonzero((coord >= low - half_cell) & (coord <= high + half_cell))[0]
+        if inside.size == 0:
+            raise ValueError(f"Basin bounds {bounds} fall outside the grid")
+        window[dim] = slice(int(inside[0]), int(inside[-1]) + 1)
+    return window
+
+
+def labels_to_window(labels):
+    # Integer index window of the cells covered by any basin
+    rows = np.nonzero(labels.any(axis=(0, 2)))[0]
+    cols = np.nonzero(labels.any(axis=(0, 1)))[0]
+    if rows.size == 0:
+        raise ValueError("The basins do not cover any cell of the grid")
+    return {"lat": slice(int(rows[0]), int(rows[-1]) + 1), "lon": slice(int(cols[0]), int(cols[-1]) + 1)}
+
+
+def subset_window(dataset, window):
+    # Lazy hyperslab: only these lat/lon indices are read from disk
+    subset = dataset.isel(window)
+    return subset.rio.set_spatial_dims("lon", "lat", inplace=True)
+
+
+def build_labels(dataset, shapefiles_folder, basin_files, all_touched=False, mask_cache_folder=None):
+    # Window of the basins and label grids over that window;
+    # from mask_cache when a cache folder is set (masks are on the full grid)
+    if mask_cache_folder is not None:
+        masks = load_or_build_masks(dataset, shapefiles_folder, basin_files, mask_cache_folder,
+                                    all_touched=all_touched)
+        labels = labels_from_masks(masks)
+        window = labels_to_window(labels)
+        return window, labels[:, window["lat"], window["lon"]]
+
+    geometries = read_basin_geometries(shapefiles_folder, basin_files)
+    bounds = np.array([geometry.bounds for geometry in geometries])
+    union_bounds = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+    window = bounds_to_window(dataset, union_bounds)
+    # Rasterize only over the window, not the full continental grid
+    labels = rasterize_basins(subset_window(dataset, window), geometries, all_touched=all_touched)
+    return window, labels
+
+
+def write_basin(data, labels, label, output_path, drop_grid_mapping=False, compute=True,
+                encoding_profile=None):
+    clipped_data = clip_to_label(data, labels, label)
+
+    # Remove the grid_mapping attribute to avoid the ValueError
+    if drop_grid_mapping and 'grid_mapping' in clipped_data.attrs:
+        del clipped_data.attrs['grid_mapping']
+
+    # compute=False returns a dask delayed write for the streaming mode
+    return write_output(clipped_data, output_path, encoding_profile, compute=compute)
+
+
+def clip_netcdf_all_basins(netcdf_path, shapefiles_folder, output_folder, name_output,
+                           variable=None, preprocess=None, open_kwargs=None,
+                           all_touched=False, drop_grid_mapping=False, mask_cache_folder=None,
+                           basin_files=None, chunk_time=None, encoding_profile=None):
+    # Reads the NetCDF once and writes one clipped file per basin
+    # chunk_time streams the source instead of loading it: peak memory ~ one time chunk
+    # encoding_profile: see output_encoding.ENCODING_PROFILES (None writes a bare to_netcdf)
+    print(f"Processing (single pass): {netcdf_path}")
+    if basin_files is None:
+        basin_files = list_basin_files(shapefiles_folder)
+
+    dataset = open_for_clip(netcdf_path, variable, preprocess, open_kwargs, chunk_time)
+    window, labels = build_labels(dataset, shapefiles_folder, basin_files, all_touched, mask_cache_folder)
+    data = subset_window(dataset, window)
+    streaming = chunk_time is not None
+    if not streaming:
+        data = data.load()
+
+    output_paths = []
+    writes = []
+    for label, shapefile_name in enumerate(basin_files, start=1):
+        output_path = basin_output_path(output_folder, name_output, shapefile_name)
+        writes.append(write_basin(data, labels, label, output_path, drop_grid_mapping,
+                                  compute=not streaming, encoding_profile=encoding_profile))
+        output_paths.append(output_path_for(output_path, encoding_profile))
+        if not streaming:
+            print(f"Finished processing: {shapefile_name}")
+
+    if streaming:
+        # One graph for every basin: each source chunk is read once and written to all
+        # outputs; the synchronous scheduler keeps a single chunk in memory at a time
+        dask.compute(*writes, scheduler='synchronous')
+        print(f"Finished processing: {', '.join(basin_files)}")
+
+    dataset.close()
+    return output_paths
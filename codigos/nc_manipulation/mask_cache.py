@@ -0,0 +1,107 @@
+#Cache en disco de mascaras de cuenca rasterizadas, por firma de grilla
+
+import os
+import glob
+import hashlib
+import numpy as np
+from rasterio import features
+
+# Cache file name: {basin}__{gpkg hash}__{grid signature}__{all_touched}.npy
+CACHE_SEPARATOR = "__"
+
+
+def grid_signature(data):
+    # Hash of the lat/lon coordinate values; files on the same grid share masks
+    digest = hashlib.sha1()
+    for coord in ("lat", "lon"):
+        values = np.ascontiguousarray(data[coord].values, dtype="float64")
+        digest.update(coord.encode())
+        digest.update(str(values.shape).encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def file_hash(path, block_size=1 << 20):
+    # Content hash of the gpkg, so an edited basin never reuses an old mask
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def mask_cache_path(cache_folder, basin_name, gpkg_hash, grid_sig, all_touched):
+    name = CACHE_SEPARATOR.join([basin_name, gpkg_hash, grid_sig, str(int(all_touched))])
+    return os.path.join(cache_folder, f"{name}.npy")
+
+
+def _remove_if_exists(path):
+    # Another worker may have removed it first
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def invalidate_basin(cache_folder, basin_name, gpkg_hash):
+    # Drop every mask of this basin that was built from another version of the gpkg
+    removed = 0
+    for path in glob.glob(os.path.join(cache_folder, f"{basin_name}{CACHE_SEPARATOR}*.npy")):
+        if os.path.basename(path).split(CACHE_SEPARATOR)[1] != gpkg_hash:
+            _remove_if_exists(path)
+            removed += 1
+    return removed
+
+
+def evict_masks(cache_folder, max_entries):
+    # Least recently used first (hits refresh the mtime)
+    paths = [p for p in glob.glob(os.path.join(cache_folder, "*.npy")) if not p.endswith(".tmp.npy")]
+    if max_entries is None or len(paths) <= max_entries:
+        return 0
+    paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    stale = paths[:len(paths) - max_entries]
+    for path in stale:
+        _remove_if_exists(path)
+    return len(stale)
+
+
+def rasterize_basin(data, shapefile_path, all_touched=False):
+    # Boolean mask of one basin, same rasterization as rio.clip
+    import geopandas as gpd  # only needed on a cache miss
+
+    shapefile = gpd.read_file(shapefile_path)
+    return features.geometry_mask(
+        [shapefile.geometry.unary_union],
+        out_shape=(int(data.rio.height), int(data.rio.width)),
+        transform=data.rio.transform(recalc=True),
+        invert=True,
+        all_touched=all_touched,
+    )
+
+
+def load_or_build_masks(data, shapefiles_folder, basin_files, cache_folder,
+                        all_touched=False, max_entries=256):
+    # One boolean mask per basin; hits are memory-mapped and skip geopandas entirely
+    os.makedirs(cache_folder, exist_ok=True)
+    grid_sig = grid_signature(data)
+
+    masks = []
+    for shapefile_name in basin_files:
+        shapefile_path = os.path.join(shapefiles_folder, shapefile_name)
+        basin_name = shapefile_name[:-5]
+        gpkg_hash = file_hash(shapefile_path)
+        invalidate_basin(cache_folder, basin_name, gpkg_hash)
+
+        path = mask_cache_path(cache_folder, basin_name, gpkg_hash, grid_sig, all_touched)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            mask = rasterize_basin(data, shapefile_path, all_touched=all_touched)
+            # Per-process temporary name: batch_clip workers may build the same mask at once
+            tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, mask)
+            os.replace(tmp_path, path)
+        masks.append(np.load(path, mmap_mode="r"))
+
+    evict_masks(cache_folder, max_entries)
+    return masks
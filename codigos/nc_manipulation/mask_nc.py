@@ -3,6 +3,7 @@ import geopandas as gpd
 import xarray as xr
 from shapely.geometry import Polygon
 from geopandas.tools import overlay
+from clip_engine import clip_netcdf_all_basins
 
 def clip_netcdf_with_shapefile(netcdf_path, shapefile_path, output_path):
     print(f"Processing: {shapefile_path}")
@@ -44,7 +45,14 @@ def clip_netcdf_with_shapefile(netcdf_path, shapefile_path, output_path):
     dataset.close()
     print(f"Finished processing: {shapefile_path}")
 
-def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder, name_output):
+def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder, name_output, single_pass=False, mask_cache_folder=None, chunk_time=None, encoding_profile=None):
+    # Single pass: read the NetCDF once and write every basin from one label grid
+    if single_pass:
+        return clip_netcdf_all_basins(netcdf_path, shapefiles_folder, output_folder, name_output,
+                                      variable='temp', drop_grid_mapping=True,
+                                      mask_cache_folder=mask_cache_folder, chunk_time=chunk_time,
+                                      encoding_profile=encoding_profile)
+
     # Iterate over all shapefiles in the specified folder
     for shapefile_name in os.listdir(shapefiles_folder):
         if shapefile_name.endswith(".gpkg"):
@@ -61,6 +69,12 @@ netcdf_path = "/media/duilio/8277-C610/OGGM/insumos/CHELSA/CHELSA_OGGM_1979_2019
 shapefiles_folder = '/media/duilio/8277-C610/OGGM/insumos/cuencas'
 output_folder = '/media/duilio/8277-C610/OGGM/insumos/CHELSA/clipped_version'
 name_output = 'CHELSA_T2M'
+single_pass = True
+mask_cache_folder = os.path.join(shapefiles_folder, 'mask_cache')
+# Streaming clip: time steps per chunk (None loads the whole cube)
+chunk_time = 120
+# Output encoding: None (bare to_netcdf, same files as before); opt in to 'time_series' (zlib + float32 + time chunks) or 'time_series_zarr' for smaller files
+encoding_profile = None
 
 print(name_output)
-clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder, name_output)
+clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder, name_output, single_pass, mask_cache_folder, chunk_time, encoding_profile)
@@ -7,6 +7,9 @@ from shapely.geometry import Polygon
 from geopandas.tools import overlay
 from glob import glob
 import pandas as pd 
+from functools import partial
+from clip_engine import clip_netcdf_all_basins
+from batch_clip import clip_batch
 
 #folder_path = "/media/duilio/8277-C610/OGGM/insumos/GCM_BH5/input_cluster/analisis_data/bias_corrected"
 folder_path = "/media/duilio/8277-C610/OGGM/insumos/GCM_BH5/input_cluster/original"
@@ -33,6 +36,10 @@ def manual_decode_time_units(dataset, units, reference_date):
     return dataset
 
 
+# Picklable for the batch workers (a lambda is not)
+decode_bh5_time = partial(manual_decode_time_units, units='months since', reference_date='2020-01-31')
+
+
 def clip_netcdf_with_shapefile(netcdf_path, shapefile_path, output_path):
     print(f"Processing: {shapefile_path}")
     
@@ -70,7 +77,15 @@ def clip_netcdf_with_shapefile(netcdf_path, shapefile_path, output_path):
     print(f"Finished processing: {shapefile_path}")
 
 
-def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder,name_output):
+def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder,name_output, single_pass=False, mask_cache_folder=None, chunk_time=None, encoding_profile=None):
+    # Single pass: read the NetCDF once and write every basin from one label grid
+    if single_pass:
+        return clip_netcdf_all_basins(netcdf_path, shapefiles_folder, output_folder, name_output,
+                                      open_kwargs={'decode_times': False},
+                                      preprocess=decode_bh5_time,
+                                      mask_cache_folder=mask_cache_folder, chunk_time=chunk_time,
+                                      encoding_profile=encoding_profile)
+
     # Iterate over all shapefiles in the specified folder
     for shapefile_name in os.listdir(shapefiles_folder):
         if shapefile_name.endswith(".gpkg"):
@@ -86,6 +101,15 @@ def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder
 shapefiles_folder = '/media/duilio/8277-C610/OGGM/insumos/cuencas'
 #output_folder = '/media/duilio/8277-C610/OGGM/insumos/GCM_BH5/input_cluster/analisis_data/bias_corrected/clipped_version'
 output_folder = '/media/duilio/8277-C610/OGGM/insumos/GCM_BH5/input_cluster/original/original_clipped'
+single_pass = True
+mask_cache_folder = os.path.join(shapefiles_folder, 'mask_cache')
+# Streaming clip: time steps per chunk (None loads the whole cube)
+chunk_time = 120
+# Output encoding: None (bare to_netcdf, same files as before); opt in to 'time_series' (zlib + float32 + time chunks) or 'time_series_zarr' for smaller files
+encoding_profile = None
+# Batch mode: n_workers > 1 runs one job per file in a process pool (at most n_workers)
+n_workers = os.cpu_count()
+memory_budget_mb = 8000  # total for the batch: caps the workers and chunks the files that do not fit
 import re
 
 def extract_file_names(input_string):
@@ -96,11 +120,18 @@ def extract_file_names(input_string):
 
 
 # Clip NetCDF for all shapefiles in the folde
-for netcdf_file in netcdf_files_path:
-    print(netcdf_file)
-   #name_output=str(netcdf_file[65:-3])
-    name_output=extract_file_names(netcdf_file)
-    name_output=name_output[0]
-    print(name_output)
-    clip_netcdf_for_all_shapefiles(netcdf_file, shapefiles_folder, output_folder,name_output)
+if n_workers > 1:
+    netcdf_files = [(netcdf_file, extract_file_names(netcdf_file)[0]) for netcdf_file in netcdf_files_path]
+    clip_report = clip_batch(netcdf_files, shapefiles_folder, output_folder, n_workers=n_workers,
+                             memory_budget_mb=memory_budget_mb, open_kwargs={'decode_times': False},
+                             preprocess=decode_bh5_time, mask_cache_folder=mask_cache_folder,
+                             chunk_time=chunk_time, encoding_profile=encoding_profile)
+else:
+    for netcdf_file in netcdf_files_path:
+        print(netcdf_file)
+       #name_output=str(netcdf_file[65:-3])
+        name_output=extract_file_names(netcdf_file)
+        name_output=name_output[0]
+        print(name_output)
+        clip_netcdf_for_all_shapefiles(netcdf_file, shapefiles_folder, output_folder,name_output, single_pass, mask_cache_folder, chunk_time, encoding_profile)
 
@@ -6,6 +6,8 @@ import xarray as xr
 from shapely.geometry import Polygon
 from geopandas.tools import overlay
 from glob import glob
+from clip_engine import clip_netcdf_all_basins
+from batch_clip import clip_batch
 
 
 folder_path = "/media/duilio/8277-C610/OGGM/insumos/GCM_bias_CHELSA"
@@ -16,6 +18,14 @@ file_pattern = os.path.join(folder_path, "*PP*.nc")
 # Use glob to find files matching the pattern
 netcdf_files_path = glob(file_pattern)
 
+# Output names: the file stem without its first 12 characters, PP_CHELSA_{model}_ssp{N}_{bbc}
+# (same as the old netcdf_file[65:-3] with the 53-character folder_path), as parse_cmip6_name expects
+file_name_prefix = 12
+
+
+def output_name(netcdf_file):
+    return os.path.splitext(os.path.basename(netcdf_file))[0][file_name_prefix:]
+
 # Print the list of NetCDF files
 
 
@@ -55,7 +65,13 @@ def clip_netcdf_with_shapefile(netcdf_path, shapefile_path, output_path):
     print(f"Finished processing: {shapefile_path}")
 
 
-def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder,name_output):
+def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder,name_output, single_pass=False, mask_cache_folder=None, chunk_time=None, encoding_profile=None):
+    # Single pass: read the NetCDF once and write every basin from one label grid
+    if single_pass:
+        return clip_netcdf_all_basins(netcdf_path, shapefiles_folder, output_folder, name_output,
+                                      mask_cache_folder=mask_cache_folder, chunk_time=chunk_time,
+                                      encoding_profile=encoding_profile)
+
     # Iterate over all shapefiles in the specified folder
     for shapefile_name in os.listdir(shapefiles_folder):
         if shapefile_name.endswith(".gpkg"):
@@ -71,14 +87,29 @@ def clip_netcdf_for_all_shapefiles(netcdf_path, shapefiles_folder, output_folder
 netcdf_path = "/media/duilio/8277-C610/OGGM/insumos/gcm_bias_corrected_cr2met25/PP_CR2MET_ACCESS-CM2_ssp126_DQM.nc"
 shapefiles_folder = '/media/duilio/8277-C610/OGGM/insumos/cuencas'
 output_folder = '/media/duilio/8277-C610/OGGM/insumos/GCM_bias_CHELSA/clipped_version'
+single_pass = True
+mask_cache_folder = os.path.join(shapefiles_folder, 'mask_cache')
+# Streaming clip: time steps per chunk (None loads the whole cube)
+chunk_time = 120
+# Output encoding: None (bare to_netcdf, same files as before); opt in to 'time_series' (zlib + float32 + time chunks) or 'time_series_zarr' for smaller files
+encoding_profile = None
+# Batch mode: n_workers > 1 runs one job per file in a process pool (at most n_workers)
+n_workers = os.cpu_count()
+memory_budget_mb = 8000  # total for the batch: caps the workers and chunks the files that do not fit
 
 
 
 
 # Clip NetCDF for all shapefiles in the folde
-for netcdf_file in netcdf_files_path:
-    print(netcdf_file)
-    name_output=str(netcdf_file[65:-3])
-    print(name_output)
-    clip_netcdf_for_all_shapefiles(netcdf_file, shapefiles_folder, output_folder,name_output)
+if n_workers > 1:
+    netcdf_files = [(netcdf_file, output_name(netcdf_file)) for netcdf_file in netcdf_files_path]
+    clip_report = clip_batch(netcdf_files, shapefiles_folder, output_folder, n_workers=n_workers,
+                             memory_budget_mb=memory_budget_mb, mask_cache_folder=mask_cache_folder,
+                             chunk_time=chunk_time, encoding_profile=encoding_profile)
+else:
+    for netcdf_file in netcdf_files_path:
+        print(netcdf_file)
+        name_output=output_name(netcdf_file)
+        print(name_output)
+        clip_netcdf_for_all_shapefiles(netcdf_file, shapefiles_folder, output_folder,name_output, single_pass, mask_cache_folder, chunk_time, encoding_profile)
 
@@ -0,0 +1,90 @@
+#Perfiles de codificacion para los NetCDF recortados (compresion, float32, chunks)
+
+import xarray as xr
+
+# backend: 'netcdf' or 'zarr'
+# complevel/shuffle: zlib deflate level and byte shuffle (netcdf)
+# float32: store float64 variables as float32
+# chunk_mb: target chunk size; chunks span the whole basin grid and as many time steps as fit,
+#           which suits the downstream mean(dim=('lat','lon')) over the full series
+ENCODING_PROFILES = {
+    'default': None,
+    'time_series': {'backend': 'netcdf', 'complevel': 4, 'shuffle': True, 'float32': True, 'chunk_mb': 4},
+    'time_series_zarr': {'backend': 'zarr', 'float32': True, 'chunk_mb': 4},
+}
+
+# Storage settings inherited from the source file that no longer fit the clipped output
+STALE_ENCODING_KEYS = ('chunksizes', 'contiguous', 'zlib', 'complevel', 'shuffle', 'compression',
+                       'original_shape', 'preferred_chunks', 'chunks', 'compressor', 'compressors',
+                       'filters', 'szip', 'zstd', 'bzip2', 'blosc', 'fletcher32', 'source')
+
+
+def get_profile(profile):
+    # Accepts a profile name, a dict of settings or None (bare to_netcdf as before)
+    if profile is None or isinstance(profile, dict):
+        return profile
+    if profile not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile '{profile}', use one of {list(ENCODING_PROFILES)}")
+    return ENCODING_PROFILES[profile]
+
+
+def time_series_chunks(data_array, chunk_mb):
+    # Full spatial extent per chunk, time length chosen to reach about chunk_mb
+    sizes = dict(data_array.sizes)
+    if 'time' not in sizes:
+        return tuple(sizes.values())
+    cell_bytes = data_array.dtype.itemsize
+    for dim, size in sizes.items():
+        if dim != 'time':
+            cell_bytes *= size
+    chunk_time = int(max(1, min(sizes['time'], chunk_mb * 1e6 // cell_bytes)))
+    return tuple(chunk_time if dim == 'time' else size for dim, size in sizes.items())
+
+
+def variable_encoding(data_array, settings):
+    encoding = {}
+    if settings.get('float32') and data_array.dtype == 'float64':
+        encoding['dtype'] = 'float32'
+    chunks = time_series_chunks(data_array, settings.get('chunk_mb', 4))
+    if settings.get('backend', 'netcdf') == 'zarr':
+        encoding['chunks'] = chunks
+    else:
+        encoding.update(zlib=settings.get('complevel', 4) > 0, complevel=settings.get('complevel', 4),
+                        shuffle=settings.get('shuffle', True), chunksizes=chunks)
+    return encoding
+
+
+def output_path_for(output_path, profile):
+    # Zarr stores use a .zarr directory next to where the .nc would go
+    settings = get_profile(profile)
+    if settings is not None and settings.get('backend') == 'zarr' and output_path.endswith('.nc'):
+        return output_path[:-3] + '.zarr'
+    return output_path
+
+
+def write_output(data, output_path, profile=None, compute=True):
+    # Write a clipped DataArray/Dataset with the given encoding profile
+    settings = get_profile(profile)
+    if settings is None:
+        return data.to_netcdf(output_path, compute=compute)
+
+    dataset = data.to_dataset() if isinstance(data, xr.DataArray) else data.copy()
+    encoding = {}
+    for var in dataset.data_vars:
+        if dataset[var].ndim < 2:
+            continue
+        for key in STALE_ENCODING_KEYS:
+            dataset[var].encoding.pop(key, None)
+        encoding[var] = variable_encoding(dataset[var], settings)
+        # An explicit encoding replaces the variable's one: keep its grid_mapping (rioxarray CRS)
+        if 'grid_mapping' in dataset[var].encoding:
+            encoding[var]['grid_mapping'] = dataset[var].encoding['grid_mapping']
+
+    if settings.get('backend') == 'zarr':
+        # Dask chunks must line up with the zarr chunks
+        if dataset.chunks:
+            dataset = dataset.chunk({dim: size for var in encoding
+                                     for dim, size in zip(dataset[var].dims, encoding[var]['chunks'])})
+        return dataset.to_zarr(output_path_for(output_path, settings), mode='w', encoding=encoding,
+                               compute=compute)
+    return dataset.to_netcdf(output_path, encoding=encoding, compute=compute)
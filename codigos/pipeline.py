@@ -0,0 +1,196 @@
+#Ejecucion de la cadena clip -> anomalias -> resumen -> figuras como un grafo de etapas con hashes de contenido
+#
+# A stage is a dict: name, script (run with this Python, in the script's folder), inputs and
+# outputs (files, folders or glob patterns), optional args and optional cpus (cores the script
+# uses itself, default 1; a stage with its own process pool declares os.cpu_count() so that it
+# never shares the machine with another such stage). A stage depends on every stage
+# whose outputs fall inside its inputs. The state file keeps, per stage, the key (sha1 of the
+# script, args and the content of every input file) and the sha1 of its outputs once it
+# succeeded; it is rewritten after each stage, so a crashed run resumes where it stopped.
+# A stage runs only if its key changed or its outputs are missing / changed, so a rebuild that
+# leaves an output identical does not propagate. Independent stages run concurrently while
+# their cpus fit in the core budget.
+
+import os
+import sys
+import json
+import glob
+import fnmatch
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from anomaly_manifest import fingerprint
+
+
+def expand(paths):
+    # Sorted files behind a list of files, folders (recursive) and glob patterns
+    files = set()
+    for path in paths:
+        if glob.has_magic(path):
+            files.update(f for f in glob.glob(path, recursive=True) if os.path.isfile(f))
+        elif os.path.isdir(path):
+            files.update(os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+        elif os.path.isfile(path):
+            files.add(path)
+    return sorted(os.path.abspath(f) for f in files)
+
+
+def _feeds(output, input_path):
+    # True if files written as `output` can be read as `input_path`
+    output, input_path = os.path.abspath(output), os.path.abspath(input_path)
+    if glob.has_magic(input_path):
+        # a pattern is fed by matching files and by folders holding its fixed part
+        parts = input_path.split(os.sep)
+        root = os.sep.join(parts[:next(i for i, part in enumerate(parts) if glob.has_magic(part))])
+        return fnmatch.fnmatch(output, input_path) or root == output or root.startswith(output + os.sep)
+    return (output == input_path or output.startswith(input_path + os.sep)
+            or input_path.startswith(output + os.sep))
+
+
+def dependencies(stages):
+    # name -> names of the stages it reads from; ValueError on cycles or duplicated names
+    names = [stage['name'] for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Duplicated stage names")
+    depends = {stage['name']: {other['name'] for other in stages if other is not stage
+                               and any(_feeds(o, i) for o in other['outputs'] for i in stage['inputs'])}
+               for stage in stages}
+    checked = set()
+
+    def visit(name, path):
+        if name in path:
+            raise ValueError(f"Cycle in the pipeline: {' -> '.join(path + [name])}")
+        if name not in checked:
+            for dependency in sorted(depends[name]):
+                visit(dependency, path + [name])
+            checked.add(name)
+
+    for name in names:
+        visit(name, [])
+    return depends
+
+
+class _State:
+    # JSON state (stage records and file fingerprints), saved atomically after every change
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'stages': {}, 'files': {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def digest(self, paths):
+        # sha1 over (path, sha1) of the files; only files whose size/mtime moved are hashed again
+        digest = hashlib.sha1()
+        for path in expand(paths):
+            with self.lock:
+                known = self.data['files'].get(path)
+            stamp = fingerprint(path, tuple(known) if known else None)
+            with self.lock:
+                self.data['files'][path] = list(stamp)
+            digest.update(f"{path}\0{stamp[2]}\n".encode())
+        return digest.hexdigest()
+
+    def save(self):
+        with self.lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def stage_key(stage, state):
+    command = json.dumps([os.path.abspath(stage['script']), list(stage.get('args', []))])
+    return hashlib.sha1((command + state.digest([stage['script']] + list(stage['inputs']))).encode()).hexdigest()
+
+
+def _is_fresh(stage, key, state):
+    record = state.data['stages'].get(stage['name'])
+    if record is None or record['key'] != key:
+        return False
+    if any(not glob.has_magic(o) and not os.path.exists(o) for o in stage['outputs']) or not expand(stage['outputs']):
+        return False
+    return state.digest(stage['outputs']) == record['outputs']
+
+
+def _run_stage(stage, log_folder):
+    # Runs the script in its folder; output goes to <log_folder>/<name>.log
+    script = os.path.abspath(stage['script'])
+    log_path = os.path.join(log_folder, f"{stage['name']}.log")
+    with open(log_path, 'w') as log:
+        process = subprocess.run([sys.executable, script] + [str(a) for a in stage.get('args', [])],
+                                 cwd=os.path.dirname(script), stdout=log, stderr=subprocess.STDOUT)
+    return process.returncode
+
+
+def run_pipeline(stages, state_path, n_workers=None, force=(), dry_run=False, cpus=None):
+    # Runs the stale stages in dependency order, up to n_workers at a time and up to `cpus` cores
+    # (default os.cpu_count()) of declared stage cpus; a stage that needs more runs alone.
+    # force: names to rerun anyway. Returns {name: 'up to date' | 'done' | 'failed' | 'blocked' |
+    # 'stale'}; a failed stage blocks its dependents but not the rest. dry_run only reports,
+    # from the current inputs
+    depends = dependencies(stages)
+    by_name = {stage['name']: stage for stage in stages}
+    state = _State(state_path)
+    log_folder = os.path.splitext(state_path)[0] + '_logs'
+    os.makedirs(log_folder, exist_ok=True)
+    status, running, keys = {}, {}, {}
+    cpus = cpus or os.cpu_count() or 1
+
+    def busy():
+        return sum(by_name[name].get('cpus', 1) for name in running.values())
+
+    with ThreadPoolExecutor(max_workers=n_workers or os.cpu_count()) as pool:
+        while len(status) < len(stages):
+            for name, stage in by_name.items():
+                if name in status or name in running.values():
+                    continue
+                upstream = [status.get(d) for d in depends[name]]
+                if any(s in ('failed', 'blocked') for s in upstream):
+                    status[name] = 'blocked'
+                    print(f"[{name}] blocked")
+                    continue
+                if dry_run and any(s == 'stale' for s in upstream):
+                    status[name] = 'stale'
+                    print(f"[{name}] would run")
+                    continue
+                if any(s is None for s in upstream):
+                    continue
+                key = stage_key(stage, state)
+                if name not in force and _is_fresh(stage, key, state):
+                    status[name] = 'up to date'
+                    print(f"[{name}] up to date")
+                elif dry_run:
+                    status[name] = 'stale'
+                    print(f"[{name}] would run")
+                elif running and busy() + stage.get('cpus', 1) > cpus:
+                    continue
+                else:
+                    print(f"[{name}] running")
+                    running[pool.submit(_run_stage, stage, log_folder)] = name
+                    keys[name] = key
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                stage = by_name[name]
+                try:
+                    returncode = future.result()
+                except Exception as error:
+                    # e.g. the log file could not be opened: the stage failed, the run goes on
+                    print(f"[{name}] error: {error!r}")
+                    returncode = None
+                if returncode == 0:
+                    state.data['stages'][name] = {'key': keys[name], 'outputs': state.digest(stage['outputs'])}
+                    state.save()
+                    status[name] = 'done'
+                    print(f"[{name}] done")
+                else:
+                    status[name] = 'failed'
+                    print(f"[{name}] failed (see {os.path.join(log_folder, name + '.log')})")
+    state.save()
+    return status
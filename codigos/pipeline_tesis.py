@@ -0,0 +1,104 @@
+import os
+import sys
+from pipeline import run_pipeline
+from runoff_store import RUNOFF_STORE, RUNOFF_SOURCES
+
+# === Cadena completa: anomalias -> resumen -> figuras y el almacen de runoff, con el clip opcional (ver pipeline.py)
+# Solo se ejecutan las etapas cuyos scripts / entradas cambiaron de contenido, o cuyas salidas
+# faltan o fueron modificadas; las que no dependen entre si corren en paralelo.
+insumos = '/media/duilio/8277-C610/OGGM/insumos'
+anomalias_path = '/media/duilio/8277-C610/OGGM/Thesis/tex/anomalias'
+figuras_path = '/media/duilio/8277-C610/OGGM/Thesis/tex/figuras_v2'
+state_path = os.path.join(insumos, 'pipeline_state.json')
+
+# Etapas simultaneas. Los clips y las anomalias reparten su trabajo en un pool de procesos propio:
+# declaran cpus = todos los nucleos y corren de a una; las demas etapas (1 nucleo) van en paralelo
+n_workers = 2
+pool_cpus = os.cpu_count()
+
+codigos = os.path.dirname(os.path.abspath(__file__))
+nc_manipulation = os.path.join(codigos, 'nc_manipulation')
+cuencas = os.path.join(insumos, 'cuencas', '*.gpkg')  # mask_cache y weights_cache son caches, no entradas
+
+CLIP_MODULES = [os.path.join(nc_manipulation, name)
+                for name in ('clip_engine.py', 'mask_cache.py', 'output_encoding.py', 'batch_clip.py')]
+ANOMALY_MODULES = [os.path.join(codigos, name)
+                   for name in ('anomaly_engine.py', 'anomaly_manifest.py', 'zonal_stats.py', 'basin_store.py',
+                                'unit_conversion.py', 'quantile_sketch.py', 'nc_catalog.py', 'prefetch.py')]
+
+
+def anomalias(name):
+    return os.path.join(anomalias_path, name)
+
+
+# Las anomalias leen los cubos completos y promedian por cuenca con zonal_stats, asi que el clip
+# por cuenca ya no es parte de la cadena; run_clips = True agrega las etapas que generan los
+# *_clipped (p. ej. para los notebooks que los leen)
+run_clips = False
+
+clip_stages = [
+    # --- Clip por cuenca (opcional)
+    {'name': 'clip_chelsa', 'script': os.path.join(nc_manipulation, 'mask_nc.py'),
+     'cpus': pool_cpus,
+     'inputs': [os.path.join(insumos, 'CHELSA', 'CHELSA_OGGM_1979_2019_masked.nc'), cuencas] + CLIP_MODULES,
+     'outputs': [os.path.join(insumos, 'CHELSA', 'clipped_version')]},
+    {'name': 'clip_gcm_chelsa', 'script': os.path.join(nc_manipulation, 'nc_variable_compiler.py'),
+     'cpus': pool_cpus,
+     'inputs': [os.path.join(insumos, 'GCM_bias_CHELSA', '*PP*.nc'), cuencas] + CLIP_MODULES,
+     'outputs': [os.path.join(insumos, 'GCM_bias_CHELSA', 'clipped_version')]},
+    {'name': 'clip_bh5', 'script': os.path.join(nc_manipulation, 'mask_nc_bh5.py'),
+     'cpus': pool_cpus,
+     'inputs': [os.path.join(insumos, 'GCM_BH5', 'input_cluster', 'original', '*pr*.nc'), cuencas] + CLIP_MODULES,
+     'outputs': [os.path.join(insumos, 'GCM_BH5', 'input_cluster', 'original', 'original_clipped')]},
+]
+
+# Los manifiestos (*_manifest.csv), el basin_store y el catalogo son caches de cada script:
+# no se declaran como salidas ni entradas
+stages = [
+    # --- Anomalias por producto (cubos completos + cuencas)
+    {'name': 'anomalias_cmip6_chelsa', 'script': os.path.join(codigos, 'anomalias_cmip6_chelsa.py'),
+     'cpus': pool_cpus,
+     'inputs': [os.path.join(insumos, 'CHELSA', 'CHELSA_OGGM_1979_2019_masked.nc'),
+                os.path.join(insumos, 'CHELSA', 'pr_chelsa_converted.nc'),
+                os.path.join(insumos, 'GCM_bias_CHELSA', '*.nc'), cuencas] + ANOMALY_MODULES,
+     'outputs': [anomalias(f'cmip6_chelsa_anomalias_{v}{s}.csv') for v in ('pr', 'tas') for s in ('', '_broad_summary')]},
+    {'name': 'anomalias_cmip6_cr2met', 'script': os.path.join(codigos, 'anomalias_cmip6_cr2met.py'),
+     'cpus': pool_cpus,
+     'inputs': [os.path.join(insumos, 'CR2MET25', 'CR2MET_*.nc'),
+                os.path.join(insumos, 'GCM_cr2met_corregido', '*.nc'), cuencas] + ANOMALY_MODULES,
+     'outputs': [anomalias(f'cmip6_cr2met_anomalias_{v}_{s}.csv') for v in ('pr', 'tas') for s in ('full', 'broad')]},
+    {'name': 'anomalias_cmip5_cr2met', 'script': os.path.join(codigos, 'anomalias_cmip5_cr2met.py'),
+     'cpus': pool_cpus,
+     'inputs': [os.path.join(insumos, 'CR2MET25', 'CR2MET_*.nc'),
+                os.path.join(insumos, 'GCM_BH5', 'input_cluster', 'original', '*.nc'), cuencas] + ANOMALY_MODULES,
+     'outputs': [anomalias('cmip5_cr2met_anomalias_broad_final_CORREGIDO.csv'),
+                 anomalias('cmip5_cr2met_anomalias_broad_summary_CORREGIDO.csv')]},
+
+    # --- Almacen Parquet de runoff (solo se reingieren los CSV que cambiaron)
+    {'name': 'ingesta_runoff', 'script': os.path.join(codigos, 'ingesta_runoff.py'),
+     'inputs': sorted(path for path, _, _ in RUNOFF_SOURCES.values())
+               + [os.path.join(codigos, name) for name in ('runoff_store.py', 'anomaly_manifest.py')],
+     'outputs': [RUNOFF_STORE]},
+
+    # --- Resumen por cuenca y figuras
+    {'name': 'resumen_anomalias', 'script': os.path.join(codigos, 'resumen_anomalias.py'),
+     'inputs': [anomalias('cmip6_chelsa_anomalias_pr_broad_summary.csv'),
+                anomalias('cmip6_chelsa_anomalias_tas_broad_summary.csv'),
+                anomalias('cmip6_cr2met_anomalias_pr_broad.csv'), anomalias('cmip6_cr2met_anomalias_tas_broad.csv'),
+                anomalias('cmip5_cr2met_anomalias_broad_summary_CORREGIDO.csv')],
+     'outputs': [anomalias('anomalia_temperatura.csv'), anomalias('anomalia_precipitaciones.csv')]},
+    {'name': 'figuras_anomalias', 'script': os.path.join(codigos, 'anomalia_graficos.py'),
+     'inputs': [anomalias('anomalia_temperatura.csv'), anomalias('anomalia_precipitaciones.csv'),
+                os.path.join(codigos, 'anomaly_figures.py')],
+     'outputs': [os.path.join(figuras_path, 'anomalia_temperatura.png'),
+                 os.path.join(figuras_path, 'anomalia_precipitacion.png')]},
+]
+if run_clips:
+    stages = clip_stages + stages
+
+# Etapas a repetir aunque esten al dia (p. ej. ['figuras_anomalias'])
+force = []
+
+status = run_pipeline(stages, state_path, n_workers=n_workers, force=force)
+if any(s in ('failed', 'blocked') for s in status.values()):
+    sys.exit(1)
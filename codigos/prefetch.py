@@ -0,0 +1,42 @@
+#Lectura anticipada en hilos: los proximos N archivos se leen y decodifican mientras se procesa el actual
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_ahead(path, block_size=8 << 20):
+    # Pulls the whole file into the page cache before the NetCDF decode, so the decode reads
+    # from memory instead of seeking chunk by chunk on a slow (external) disk. Linux: one
+    # posix_fadvise(WILLNEED) and the kernel reads it sequentially; elsewhere a sequential read
+    if hasattr(os, 'posix_fadvise'):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+        return
+    with open(path, 'rb', buffering=0) as f:
+        while f.read(block_size):
+            pass
+
+
+def prefetch(items, load, n_ahead=4, n_threads=None):
+    # Yields (item, load(item)) in the order of `items`, with at most n_ahead loads running or
+    # waiting ahead of the consumer (bounded memory). Errors are raised when their item is reached
+    n_threads = n_threads or min(n_ahead, os.cpu_count() or 1)
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        pending = deque()
+        for item in iterator:
+            pending.append((item, pool.submit(load, item)))
+            if len(pending) >= n_ahead:
+                break
+        while pending:
+            item, future = pending.popleft()
+            result = future.result()
+            for next_item in iterator:
+                pending.append((next_item, pool.submit(load, next_item)))
+                break
+            yield item, result
@@ -0,0 +1,131 @@
+#Cuantiles aproximados en una pasada (sketch mergeable tipo KLL) para cubos grandes
+#
+# One sketch holds, for every cell (pixel or basin), levels of retained values: level h keeps
+# values of weight 2**h in a (cells, n_h) array. When a level grows past k values it is sorted
+# and every other value is promoted to the next level, so memory stays ~k log(n/k) per cell
+# and the rank error is O(log(n/k) / k). All cells see the same time steps, so every level is
+# a plain 2-D array and updates/merges are vectorized. While nothing has been compacted the
+# quantiles are exact (np.nanquantile).
+
+import warnings
+import numpy as np
+import xarray as xr
+
+
+def new_sketch(n_cells, k=200, seed=0):
+    return {'k': k, 'n_cells': n_cells, 'levels': [], 'rng': np.random.default_rng(seed)}
+
+
+def _compact(sketch):
+    k, levels = sketch['k'], sketch['levels']
+    h = 0
+    while h < len(levels):
+        level = levels[h]
+        if level.shape[1] > k:
+            level = np.sort(level, axis=1)  # NaN go last and are compacted like any value
+            even = level.shape[1] - level.shape[1] % 2
+            promoted = level[:, sketch['rng'].integers(2):even:2]
+            levels[h] = level[:, even:]
+            if h + 1 == len(levels):
+                levels.append(promoted)
+            else:
+                levels[h + 1] = np.concatenate([levels[h + 1], promoted], axis=1)
+        h += 1
+    return sketch
+
+
+def update_sketch(sketch, block):
+    # block: (time, cells) values of the next time steps
+    block = np.asarray(block, dtype='float64').reshape(block.shape[0], -1).T
+    if not sketch['levels']:
+        sketch['levels'].append(block)
+    else:
+        sketch['levels'][0] = np.concatenate([sketch['levels'][0], block], axis=1)
+    return _compact(sketch)
+
+
+def merge_sketches(a, b):
+    # Sketches of the same cells built on different time chunks (or workers)
+    merged = new_sketch(a['n_cells'], max(a['k'], b['k']))
+    merged['rng'] = a['rng']
+    for h in range(max(len(a['levels']), len(b['levels']))):
+        parts = [s['levels'][h] for s in (a, b) if h < len(s['levels'])]
+        merged['levels'].append(np.concatenate(parts, axis=1))
+    return _compact(merged)
+
+
+def sketch_quantiles(sketch, quantiles):
+    # (len(quantiles), cells); NaN values are ignored, all-NaN cells give NaN
+    levels = sketch['levels']
+    quantiles = np.atleast_1d(quantiles)
+    if not levels:
+        return np.full((len(quantiles), sketch['n_cells']), np.nan)
+    if len(levels) == 1:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN cells are NaN on purpose
+            return np.nanquantile(levels[0], quantiles, axis=1)
+
+    values = np.concatenate(levels, axis=1)
+    weights = np.concatenate([np.full(level.shape[1], 2.0 ** h) for h, level in enumerate(levels)])
+    order = np.argsort(values, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    weights = np.where(np.isnan(values), 0, weights[order])
+    cumulative = np.cumsum(weights, axis=1)
+    total = cumulative[:, -1:]
+
+    result = np.empty((len(quantiles), values.shape[0]))
+    for i, q in enumerate(quantiles):
+        index = np.minimum((cumulative < q * total).sum(axis=1), values.shape[1] - 1)
+        result[i] = np.take_along_axis(values, index[:, None], axis=1)[:, 0]
+    result[:, total[:, 0] == 0] = np.nan
+    return result
+
+
+def _block_sketch(block, k, seed):
+    return update_sketch(new_sketch(int(np.prod(block.shape[1:], dtype='int64')), k, seed), block)
+
+
+def _block_quantiles(sketch, quantiles, block_shape):
+    return sketch_quantiles(sketch, quantiles).reshape((len(quantiles),) + tuple(block_shape))
+
+
+def _tree_merge(sketches, merge):
+    while len(sketches) > 1:
+        sketches = [merge(sketches[i], sketches[i + 1]) if i + 1 < len(sketches) else sketches[i]
+                    for i in range(0, len(sketches), 2)]
+    return sketches[0]
+
+
+def streaming_quantiles(data_array, quantiles, dim='time', k=200, seed=0, time_step=None):
+    # Same result layout as data_array.quantile(quantiles, dim=dim), in one pass over `dim`.
+    # Dask-backed arrays: one sketch per block, tree-merged along `dim` within each spatial block
+    # (lazy, runs on the workers). numpy arrays: streamed in slices of time_step (default k) steps
+    quantiles = list(np.atleast_1d(quantiles))
+    data = data_array.transpose(dim, ...)
+    template = data.isel({dim: 0}, drop=True)
+    array = data.data
+
+    if data.chunks is not None:
+        import dask
+        import dask.array as da
+
+        blocks = array.to_delayed()
+        results = np.empty(blocks.shape[1:], dtype=object)
+        for spatial_index in np.ndindex(*blocks.shape[1:]):
+            sketches = [dask.delayed(_block_sketch)(blocks[(t,) + spatial_index], k, seed)
+                        for t in range(blocks.shape[0])]
+            merged = _tree_merge(sketches, dask.delayed(merge_sketches))
+            block_shape = tuple(array.chunks[axis + 1][i] for axis, i in enumerate(spatial_index))
+            results[spatial_index] = da.from_delayed(
+                dask.delayed(_block_quantiles)(merged, quantiles, block_shape),
+                shape=(len(quantiles),) + block_shape, dtype='float64')
+        values = da.block(results.tolist()) if results.ndim else results[()]
+    else:
+        step = time_step or k
+        sketch = new_sketch(int(np.prod(array.shape[1:], dtype='int64')), k, seed)
+        for start in range(0, array.shape[0], step):
+            update_sketch(sketch, array[start:start + step])
+        values = _block_quantiles(sketch, quantiles, array.shape[1:])
+
+    return xr.DataArray(values, dims=('quantile',) + template.dims,
+                        coords={'quantile': quantiles, **template.coords})
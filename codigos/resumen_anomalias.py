@@ -0,0 +1,44 @@
+import os
+import pandas as pd
+
+# === Resumen por cuenca, escenario y producto de las tablas broad de anomalias (entrada de anomalia_graficos.py)
+salida_path = '/media/duilio/8277-C610/OGGM/Thesis/tex/anomalias'
+
+# Tablas broad CMIP6 por producto: (Modelo, archivo pr, archivo tas); porcentajes como fraccion
+cmip6_broad = {
+    'CHELSA': ('cmip6_chelsa_anomalias_pr_broad_summary.csv', 'cmip6_chelsa_anomalias_tas_broad_summary.csv'),
+    'CR2MET': ('cmip6_cr2met_anomalias_pr_broad.csv', 'cmip6_cr2met_anomalias_tas_broad.csv'),
+}
+# Tabla broad CMIP5 (CR2MET, RCP8.5); porcentajes ya en %
+cmip5_broad = 'cmip5_cr2met_anomalias_broad_summary_CORREGIDO.csv'
+
+ssp_labels = {126: 'SSP1-2.6', 585: 'SSP5-8.5'}
+
+temperature, precipitation = [], []
+for modelo, (pr_file, tas_file) in cmip6_broad.items():
+    pr = pd.read_csv(os.path.join(salida_path, pr_file))
+    tas = pd.read_csv(os.path.join(salida_path, tas_file))
+    for df in (pr, tas):
+        df['Modelo'] = modelo
+        df['ssp_list'] = df['ssp_list'].map(ssp_labels)
+    tas = tas[['basin', 'Modelo', 'ssp_list', 'mean_temperature', 'std_temperature']]
+    pr = pr.assign(mean_precipitation_perc=pr['mean_precipitation_perc'] * 100,
+                   std_precipitation_perc=pr['std_precipitation_perc'] * 100)
+    temperature.append(tas)
+    precipitation.append(pr[['basin', 'Modelo', 'ssp_list', 'mean_precipitation_perc', 'std_precipitation_perc']])
+
+cmip5 = pd.read_csv(os.path.join(salida_path, cmip5_broad))
+cmip5['basin'] = cmip5['basin'].str.split('_').str[1].astype(int)
+cmip5['Modelo'], cmip5['ssp_list'] = 'CR2MET', 'RCP8.5'
+temperature.append(cmip5.rename(columns={'Temperature_Anomaly_mean': 'mean_temperature',
+                                         'Temperature_Anomaly_std': 'std_temperature'})
+                   [['basin', 'Modelo', 'ssp_list', 'mean_temperature', 'std_temperature']])
+precipitation.append(cmip5.rename(columns={'Precipitation_Anomaly_%_mean': 'mean_precipitation_perc',
+                                           'Precipitation_Anomaly_%_std': 'std_precipitation_perc'})
+                     [['basin', 'Modelo', 'ssp_list', 'mean_precipitation_perc', 'std_precipitation_perc']])
+
+# Una fila por cuenca x producto x escenario, ordenadas por cuenca
+for rows, name in ((temperature, 'anomalia_temperatura.csv'), (precipitation, 'anomalia_precipitaciones.csv')):
+    summary = pd.concat(rows, ignore_index=True).sort_values(['basin', 'Modelo', 'ssp_list'], kind='stable')
+    summary.to_csv(os.path.join(salida_path, name), index=False)
+    print(f"✅ {name}: {len(summary)} filas")
@@ -0,0 +1,159 @@
+#Almacen Parquet de las series de runoff (OGGM): un esquema comun para todos los CSV
+#
+# Two families of CSV are normalized into one dataset partitioned by family/source:
+#   decadal: *_Combined.csv, monthly climatology per decade (COD_CUEN, Decade, Month, Mean, Std)
+#   series:  *_anual_v2*.csv and the BH5 mean_of_means file, monthly series (Year, Month, runoff)
+# Columns: family, source, dataset, scenario, COD_CUEN, Decade, Year, Month, Runoff, Runoff_Std.
+# The analyses read it with load_runoff (column and predicate pushdown) instead of read_csv.
+# update_runoff_store (ingesta_runoff.py) re-ingests only the sources whose CSV changed: the
+# fingerprint of every ingested CSV (size, mtime, sha1) is kept in <store>/_ingested.json
+# (the leading _ keeps it out of the Parquet dataset).
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from anomaly_manifest import fingerprint
+
+RUNOFF_STORE = '/mnt/data/runoff_store'
+
+# (family, source) -> (csv path, dataset, scenario)
+RUNOFF_SOURCES = {
+    ('decadal', 'BH5_CMIP5'): ('/mnt/data/BH5_CMIP5_Combined.csv', 'BH5', 'rcp85'),
+    ('decadal', 'CR2MET_CMIP6_SSP126'): ('/mnt/data/CR2MET_CMIP6_ssp126_Runoff_Combined.csv', 'CR2MET', 'ssp126'),
+    ('decadal', 'CR2MET_CMIP6_SSP585'): ('/mnt/data/CR2MET_CMIP6_ssp585_Runoff_Combined.csv', 'CR2MET', 'ssp585'),
+    ('decadal', 'CHELSA_CMIP6_SSP126'): ('/mnt/data/Runoff_CHELSA_ssp126_Combined.csv', 'CHELSA', 'ssp126'),
+    ('decadal', 'CHELSA_CMIP6_SSP585'): ('/mnt/data/Runoff_CHELSA_ssp585_Combined.csv', 'CHELSA', 'ssp585'),
+    ('decadal', 'CR2MET_CMIP5'): ('/mnt/data/Runoff_CR2MET_CMIP5_Combined.csv', 'CR2MET', 'rcp85'),
+    ('series', 'CR2MET_CMIP6_SSP126'): ('/mnt/data/Runoff_CR2MET_CMIP6_anual_ssp126_v2.csv', 'CR2MET', 'ssp126'),
+    ('series', 'CR2MET_CMIP6_SSP585'): ('/mnt/data/Runoff_CR2MET_CMIP6_anual_ssp585_v2.csv', 'CR2MET', 'ssp585'),
+    ('series', 'CHELSA_CMIP6_SSP126'): ('/mnt/data/Runoff_CHELSA_CMIP6_anual_v2_ssp126.csv', 'CHELSA', 'ssp126'),
+    ('series', 'CHELSA_CMIP6_SSP585'): ('/mnt/data/Runoff_CHELSA_CMIP6_anual_v2_ssp585.csv', 'CHELSA', 'ssp585'),
+    ('series', 'CR2MET_CMIP5'): ('/mnt/data/Runoff_CR2MET_CMIP5_anual_v2.csv', 'CR2MET', 'rcp85'),
+    ('series', 'BH5_CMIP5'): ('/mnt/data/mean_of_means_bh5_cuenca_monthly_1980_2060.csv', 'BH5', 'rcp85'),
+}
+
+SCHEMA = pa.schema([
+    ('family', pa.string()),
+    ('source', pa.string()),
+    ('dataset', pa.dictionary(pa.int8(), pa.string())),
+    ('scenario', pa.dictionary(pa.int8(), pa.string())),
+    ('COD_CUEN', pa.dictionary(pa.int8(), pa.int16())),
+    ('Decade', pa.dictionary(pa.int8(), pa.string())),
+    ('Year', pa.int16()),
+    ('Month', pa.int8()),
+    ('Runoff', pa.float32()),
+    ('Runoff_Std', pa.float32()),
+])
+
+
+def _runoff_column(df):
+    # Runoff of a series CSV: its runoff/mean column, or the sum of the RIO* columns (BH5)
+    runoff_cols = [col for col in df.columns if "Runoff" in col or "Mean" in col]
+    if runoff_cols:
+        return df[runoff_cols[0]]
+    rio_columns = [col for col in df.columns if "RIO" in col]
+    if not rio_columns:
+        raise ValueError(f"No runoff column in {list(df.columns)}")
+    return df[rio_columns].sum(axis=1)
+
+
+def normalize_runoff(df, family, source, dataset, scenario):
+    # One raw CSV -> rows of the common schema
+    n = len(df)
+    out = pd.DataFrame({'family': family, 'source': source, 'dataset': dataset, 'scenario': scenario},
+                       index=range(n))
+    if family == 'decadal':
+        out['COD_CUEN'] = df['COD_CUEN'].values
+        out['Decade'] = df['Decade'].astype(str).values
+        out['Year'] = pd.NA
+        out['Month'] = df['Month'].values
+        out['Runoff'] = df['Mean'].values
+        out['Runoff_Std'] = df['Std'].values if 'Std' in df.columns else np.nan
+    else:
+        if 'Year' in df.columns and 'Month' in df.columns:
+            year, month = df['Year'], df['Month']
+        else:
+            dates = pd.to_datetime(df['Fecha'] if 'Fecha' in df.columns else df.iloc[:, 0])
+            year, month = dates.dt.year, dates.dt.month
+        out['COD_CUEN'] = df['COD_CUEN'].values if 'COD_CUEN' in df.columns else pd.NA
+        out['Decade'] = None
+        out['Year'] = year.values
+        out['Month'] = month.values
+        out['Runoff'] = _runoff_column(df).values
+        out['Runoff_Std'] = np.nan
+
+    # Types of the schema: categories for the labels, small ints, float32
+    for column in ('dataset', 'scenario', 'Decade'):
+        out[column] = out[column].astype('category')
+    out['COD_CUEN'] = out['COD_CUEN'].astype('Int16').astype('category')
+    out['Year'] = out['Year'].astype('Int16')
+    out['Month'] = out['Month'].astype('int8')
+    out[['Runoff', 'Runoff_Std']] = out[['Runoff', 'Runoff_Std']].astype('float32')
+    return out
+
+
+def ingest_runoff(root=RUNOFF_STORE, sources=None):
+    # (Re)writes the partition of every source from its CSV
+    sources = RUNOFF_SOURCES if sources is None else sources
+    for (family, source), (path, dataset, scenario) in sources.items():
+        frame = normalize_runoff(pd.read_csv(path), family, source, dataset, scenario)
+        table = pa.Table.from_pandas(frame, schema=SCHEMA, preserve_index=False)
+        partition = os.path.join(root, f'family={family}', f'source={source}')
+        if os.path.isdir(partition):
+            shutil.rmtree(partition)
+        pq.write_to_dataset(table, root, partition_cols=['family', 'source'])
+        print(f"{family}/{source}: {len(frame)} rows")
+
+
+def _ingested_path(root):
+    return os.path.join(root, '_ingested.json')
+
+
+def update_runoff_store(root=RUNOFF_STORE, sources=None):
+    # Ingests the sources that are new, whose CSV content (sha1) changed or whose partition is
+    # missing; a touched but identical CSV is only hashed. Returns the (family, source) keys
+    # that were (re)written
+    sources = RUNOFF_SOURCES if sources is None else sources
+    ingested = {}
+    if os.path.exists(_ingested_path(root)):
+        with open(_ingested_path(root)) as f:
+            ingested = json.load(f)
+
+    stale = {}
+    for (family, source), entry in sources.items():
+        key = f'{family}/{source}'
+        known = ingested.get(key)
+        stamp = fingerprint(entry[0], tuple(known) if known else None)
+        partition = os.path.join(root, f'family={family}', f'source={source}')
+        if known is None or known[2] != stamp[2] or not os.path.isdir(partition):
+            stale[(family, source)] = entry
+        ingested[key] = list(stamp)
+
+    if stale:
+        ingest_runoff(root, stale)
+    os.makedirs(root, exist_ok=True)
+    tmp_path = _ingested_path(root) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(ingested, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, _ingested_path(root))
+    return list(stale)
+
+
+def load_runoff(root=RUNOFF_STORE, columns=None, **equals):
+    # Rows matching column=value (or column=[values]) filters; only `columns` are read and the
+    # family/source filters prune whole partitions. Year/Month come back as small ints
+    filters = [(column, 'in', list(value)) if isinstance(value, (list, tuple)) else (column, '==', value)
+               for column, value in equals.items()]
+    df = pd.read_parquet(root, columns=columns, filters=filters or None)
+    for column in ('family', 'source'):
+        if column in df.columns:
+            df[column] = df[column].astype(str).astype('category')
+    if 'COD_CUEN' in df.columns:
+        df['COD_CUEN'] = df['COD_CUEN'].astype('Int16').astype('category')
+    if 'Year' in df.columns:
+        df['Year'] = df['Year'].astype('Int16')
+    return df.reset_index(drop=True)
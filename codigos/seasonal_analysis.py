@@ -1,66 +1,56 @@
 import pandas as pd
-import ace_tools as tools  # Import necessary tool for displaying data
+from runoff_store import load_runoff
+from seasonal_stats import STANDARD_SEASONS, seasonal_statistics, change_table, format_change_table
 
-# Define file paths
+# Escenario -> fuente decadal del almacen de runoff (ver runoff_store.RUNOFF_SOURCES)
 files = {
-    "BH5_CMIP5": "/mnt/data/BH5_CMIP5_Combined.csv",
-    "CR2MET_CMIP6_SSP126": "/mnt/data/CR2MET_CMIP6_ssp126_Runoff_Combined.csv",
-    "CR2MET_CMIP6_SSP585": "/mnt/data/CR2MET_CMIP6_ssp585_Runoff_Combined.csv",
-    "CHELSA_SSP126": "/mnt/data/Runoff_CHELSA_ssp126_Combined.csv",
-    "CHELSA_SSP585": "/mnt/data/Runoff_CHELSA_ssp585_Combined.csv",
-    "CR2MET_CMIP5": "/mnt/data/Runoff_CR2MET_CMIP5_Combined.csv"
+    "BH5_CMIP5": "BH5_CMIP5",
+    "CR2MET_CMIP6_SSP126": "CR2MET_CMIP6_SSP126",
+    "CR2MET_CMIP6_SSP585": "CR2MET_CMIP6_SSP585",
+    "CHELSA_SSP126": "CHELSA_CMIP6_SSP126",
+    "CHELSA_SSP585": "CHELSA_CMIP6_SSP585",
+    "CR2MET_CMIP5": "CR2MET_CMIP5"
 }
 
-# Define catchment names
-catchment_mapping = {54: "Aconcagua", 57: "Maipo", 60: "Rapel", 71: "Mataquito", 73: "Maule"}
-
-# Define seasons
-seasons = {
-    "DJF": [12, 1, 2],
-    "MAM": [3, 4, 5],
-    "JJA": [6, 7, 8],
-    "SON": [9, 10, 11]
+# Diccionario con los códigos de cuenca y sus nombres
+cuencas = {
+    54: "Rio Aconcagua",
+    57: "Rio Maipo",
+    60: "Rio Rapel",
+    71: "Rio Mataquito",
+    73: "Rio Maule",
 }
 
-# Process all files
-seasonal_means = []
-for scenario, filepath in files.items():
-    df = pd.read_csv(filepath)
-    df.rename(columns={"COD_CUEN": "Cuenca"}, inplace=True)
-    df = df[df["Cuenca"].isin(catchment_mapping.keys())]
-    df["Cuenca"] = df["Cuenca"].map(catchment_mapping)
-
-    for (decade, cuenca), group in df.groupby(["Decade", "Cuenca"]):
-        for season_name, months in seasons.items():
-            subset = group[group["Month"].isin(months)]
-            mean_value = subset["Mean"].mean()
-            std_value = (subset["Std"] ** 2).sum() ** 0.5 / len(months)  # Propagation of uncertainty
-            seasonal_means.append([scenario, decade, cuenca, season_name, mean_value, std_value])
-
-# Create DataFrame with seasonal statistics
-seasonal_df = pd.DataFrame(seasonal_means, columns=["Escenario", "Decade", "Cuenca", "Estación", "Mean", "Std"])
-
-# Calculate percentage differences and absolute changes
-seasonal_df_1980_2020 = seasonal_df[seasonal_df["Decade"] == "1980-2020"].set_index(["Escenario", "Cuenca", "Estación"])
-seasonal_df_2030_2060 = seasonal_df[seasonal_df["Decade"] == "2030-2060"].set_index(["Escenario", "Cuenca", "Estación"])
-
-percentage_difference = ((seasonal_df_2030_2060["Mean"] - seasonal_df_1980_2020["Mean"]) / seasonal_df_1980_2020["Mean"]) * 100
-std_propagated = ((seasonal_df_1980_2020["Std"] ** 2 + seasonal_df_2030_2060["Std"] ** 2) ** 0.5 / seasonal_df_1980_2020["Mean"]) * 100
-absolute_change = seasonal_df_2030_2060["Mean"] - seasonal_df_1980_2020["Mean"]
-std_absolute_propagated = (seasonal_df_1980_2020["Std"] ** 2 + seasonal_df_2030_2060["Std"] ** 2) ** 0.5
-
-# Create final table with formatted results
-final_seasonal_df = pd.DataFrame({
-    "Escenario": seasonal_df_1980_2020.index.get_level_values(0),
-    "Cuenca": seasonal_df_1980_2020.index.get_level_values(1),
-    "Estación": seasonal_df_1980_2020.index.get_level_values(2),
-    "Mean (1980-2020) ± Std": seasonal_df_1980_2020["Mean"].round(2).astype(str) + " ± " + seasonal_df_1980_2020["Std"].round(2).astype(str),
-    "Mean (2030-2060) ± Std": seasonal_df_2030_2060["Mean"].round(2).astype(str) + " ± " + seasonal_df_2030_2060["Std"].round(2).astype(str),
-    "Percentage Difference ± Std": percentage_difference.round(2).astype(str) + " ± " + std_propagated.round(2).astype(str),
-    "Absolute Change (m³/s) ± Std": absolute_change.round(2).astype(str) + " ± " + std_absolute_propagated.round(2).astype(str)
-}).reset_index(drop=True)
-
-# Separate results by watershed
-for cuenca in final_seasonal_df["Cuenca"].unique():
-    cuenca_df = final_seasonal_df[final_seasonal_df["Cuenca"] == cuenca]
-    tools.display_dataframe_to_user(name=f"Seasonal Runoff Changes - {cuenca}", dataframe=cuenca_df)
+# Periodo de referencia; se compara contra todas las demas decadas
+reference = "1980-2020"
+
+# Todas las fuentes en una lectura
+df = load_runoff(columns=["source", "COD_CUEN", "Decade", "Month", "Runoff", "Runoff_Std"],
+                 family="decadal", source=list(files.values()))
+df = df[df["COD_CUEN"].isin(cuencas)]
+
+# Media estacional y error propagado sqrt(sum(Std^2)) / n, un solo groupby
+seasonal_df = seasonal_statistics(df, STANDARD_SEASONS)
+
+# Cambios absolutos y relativos respecto a la referencia, para todos los escenarios y cuencas
+changes = change_table(seasonal_df, reference=reference)
+changes["Escenario"] = changes["source"].map({source: name for name, source in files.items()})
+changes["Cuenca"] = changes["COD_CUEN"].astype(int).map(cuencas)
+diff_df = format_change_table(changes.drop(columns=["source", "COD_CUEN"]))
+diff_df = diff_df[["Escenario", "Cuenca", "Season", "Decade", "Mean_ref", "Mean_future", "Diff_Abs", "Diff_Rel"]]
+
+# Generar tablas en formato LaTeX separadas por cuenca
+# !! Los errores estacionales son sqrt(sum(Std^2)) / n, no el promedio de las Std como en las
+# diferencias_{cuenca}.tex publicadas (seasonal_analysis_by_model.py): por eso los archivos se
+# llaman diferencias_rss_{cuenca}.tex y no pisan esas tablas (error="mean" en seasonal_statistics
+# reproduce las anteriores)
+for cuenca in cuencas.values():
+    cuenca_df = diff_df[diff_df["Cuenca"] == cuenca]
+    latex_table = cuenca_df.to_latex(index=False, escape=False)
+
+    # Guardar tabla LaTeX en un archivo separado por cuenca
+    table_path = f"/mnt/data/diferencias_rss_{cuenca.replace(' ', '_').lower()}.tex"
+    with open(table_path, "w") as f:
+        f.write(latex_table)
+
+    print(f"Tabla LaTeX generada para {cuenca}: {table_path}")
@@ -1,57 +1,36 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from scipy.stats import f_oneway, kruskal
+from group_tests import batch_tests
+from runoff_store import load_runoff
+from temporal_tags import MEGADROUGHT_PERIODS, SEASON_LABELS, drought_period, season_of
 
-# Definir rutas de los archivos
-file_paths = {
-    "CHELSA_CMIP6_SSP126": "/mnt/data/Runoff_CHELSA_CMIP6_anual_v2_ssp126.csv",
-    "CHELSA_CMIP6_SSP585": "/mnt/data/Runoff_CHELSA_CMIP6_anual_v2_ssp585.csv",
-    "CR2MET_CMIP5": "/mnt/data/Runoff_CR2MET_CMIP5_anual_v2.csv",
-    "CR2MET_CMIP6_SSP585": "/mnt/data/Runoff_CR2MET_CMIP6_anual_ssp585_v2.csv",
-    "CR2MET_CMIP6_SSP126": "/mnt/data/Runoff_CR2MET_CMIP6_anual_ssp126_v2.csv",
-}
+# Series mensuales del almacen de runoff (ver runoff_store.RUNOFF_SOURCES)
+sources = ["CHELSA_CMIP6_SSP126", "CHELSA_CMIP6_SSP585", "CR2MET_CMIP5", "CR2MET_CMIP6_SSP585", "CR2MET_CMIP6_SSP126"]
 
-# Cargar los archivos en dataframes
-dataframes = {key: pd.read_csv(path) for key, path in file_paths.items()}
-
-# Crear una nueva columna de estación
-def get_season(month):
-    if month in [12, 1, 2]:
-        return "Verano (DJF)"
-    elif month in [3, 4, 5]:
-        return "Otoño (MAM)"
-    elif month in [6, 7, 8]:
-        return "Invierno (JJA)"
-    else:
-        return "Primavera (SON)"
+# Cargar las series en dataframes
+dataframes = {source: load_runoff(columns=["COD_CUEN", "Year", "Month", "Runoff"], family="series", source=source)
+              for source in sources}
 
 # Agregar la estación a cada DataFrame
 for key, df in dataframes.items():
-    df["Season"] = df["Month"].apply(get_season)
+    df["Season"] = season_of(df["Month"], "long")
 
 # Unir todos los dataframes para análisis conjunto
 seasonal_combined_df = pd.concat(dataframes.values(), keys=dataframes.keys(), names=["Dataset", "Index"]).reset_index()
 
-# Definir los períodos a comparar
-pre_megasequia_df = seasonal_combined_df[(seasonal_combined_df["Year"] >= 1980) & (seasonal_combined_df["Year"] < 2010)]
-megasequia_df = seasonal_combined_df[(seasonal_combined_df["Year"] >= 2010) & (seasonal_combined_df["Year"] <= 2021)]
-
-# Agregar una columna indicando el período
-pre_megasequia_df["Period"] = "1980-2010"
-megasequia_df["Period"] = "2010-2021"
-
-# Combinar ambos períodos en un solo DataFrame
-comparison_df = pd.concat([pre_megasequia_df, megasequia_df])
+# Período de cada fila (temporal_tags.MEGADROUGHT_PERIODS); los años fuera de ambos se descartan
+seasonal_combined_df["Period"] = drought_period(seasonal_combined_df["Year"], MEGADROUGHT_PERIODS)
+comparison_df = seasonal_combined_df.dropna(subset=["Period"])
 
 # Visualización: Boxplots del runoff por estación y período
 plt.figure(figsize=(16, 12))
-seasons = ["Verano (DJF)", "Otoño (MAM)", "Invierno (JJA)", "Primavera (SON)"]
+seasons = SEASON_LABELS["long"]
 
 for i, season in enumerate(seasons, 1):
     plt.subplot(2, 2, i)
     sns.boxplot(data=comparison_df[comparison_df["Season"] == season], 
-                x="Period", y="Mean_Runoff", hue="Dataset")
+                x="Period", y="Runoff", hue="Dataset")
     plt.title(f"Comparación del Runoff por Estación entre 1980-2010 y 2010-2021 ({season})")
     plt.xlabel("Periodo")
     plt.ylabel("Runoff Medio (m³/s)")
@@ -61,20 +40,8 @@ for i, season in enumerate(seasons, 1):
 plt.tight_layout()
 plt.show()
 
-# Análisis estadístico por estación para comparar los períodos
-period_anova_results = {}
-period_kruskal_results = {}
-
-for season in seasons:
-    for dataset in dataframes.keys():
-        df = comparison_df[comparison_df["Dataset"] == dataset]
-        season_df = df[df["Season"] == season]
-
-        groups = [season_df[season_df["Period"] == period]["Mean_Runoff"].dropna() for period in ["1980-2010", "2010-2021"]]
-
-        if all(len(group) > 1 for group in groups):
-            period_anova_results[(dataset, season)] = f_oneway(*groups)
-            period_kruskal_results[(dataset, season)] = kruskal(*groups)
-
-# Mostrar resultados estadísticos para la comparación entre períodos
-period_anova_results, period_kruskal_results
+# Pruebas ANOVA, Kruskal-Wallis y de permutación entre períodos para cada dataset x cuenca x estación
+period_tests = batch_tests(comparison_df, "Runoff", "Period", ["Dataset", "COD_CUEN", "Season"],
+                           groups=list(MEGADROUGHT_PERIODS), n_permutations=999)
+period_tests.to_csv("/mnt/data/megadrought_tests.csv", index=False)
+print(period_tests.to_string(index=False))
@@ -0,0 +1,59 @@
+#Estadisticas estacionales de runoff: media y error propagado en un solo groupby, y tablas de cambio
+#
+# The decadal climatologies hold a monthly Mean and Std per basin and decade. The seasonal mean is
+# the mean of its months and its error is propagated as independent monthly errors,
+# sqrt(sum(Std**2)) / n. (The former by-model script averaged the Std instead, which assumes
+# fully correlated months; error='mean' reproduces that.) Changes against the reference period
+# are computed for every scenario, basin, season and period in one join.
+
+import numpy as np
+from temporal_tags import season_of
+
+STANDARD_SEASONS = {
+    "DJF": [12, 1, 2],
+    "MAM": [3, 4, 5],
+    "JJA": [6, 7, 8],
+    "SON": [9, 10, 11],
+}
+
+def seasonal_statistics(df, seasons=STANDARD_SEASONS, period="Decade", keys=("source", "COD_CUEN"),
+                        value="Runoff", std="Runoff_Std", error="rss"):
+    # Mean and propagated Std per keys/period/season; months outside `seasons` are ignored
+    df = df.assign(Season=season_of(df["Month"], seasons), _var=df[std].astype('float64') ** 2)
+    grouped = df.dropna(subset=["Season"]).groupby(list(keys) + [period, "Season"], observed=True)
+    stats = grouped.agg(Mean=(value, "mean"), Var=("_var", "sum"), Std_mean=(std, "mean"),
+                        N=(value, "count")).reset_index()
+    if error == "rss":
+        stats["Std"] = np.sqrt(stats["Var"]) / stats["N"]
+    elif error == "mean":
+        stats["Std"] = stats["Std_mean"]
+    else:
+        raise ValueError(f"Unknown error propagation '{error}' (use 'rss' or 'mean')")
+    return stats.drop(columns=["Var", "Std_mean"])
+
+
+def change_table(stats, reference="1980-2020", period="Decade", keys=("source", "COD_CUEN")):
+    # Absolute and relative change of every period against `reference`, errors added in quadrature;
+    # keys: the same grouping keys given to seasonal_statistics
+    keys = list(keys) + ["Season"]
+    is_reference = stats[period] == reference
+    reference_stats = stats.loc[is_reference, keys + ["Mean", "Std"]]
+    changes = stats[~is_reference].merge(reference_stats, on=keys, suffixes=("_future", "_ref"))
+    changes["Diff_Abs"] = changes["Mean_future"] - changes["Mean_ref"]
+    changes["Error_Abs"] = np.hypot(changes["Std_future"], changes["Std_ref"])
+    changes["Diff_Rel"] = changes["Diff_Abs"] / changes["Mean_ref"] * 100
+    changes["Error_Rel"] = changes["Error_Abs"] / changes["Mean_ref"] * 100
+    return changes
+
+
+def format_change_table(changes, decimals=2):
+    # "value ± error" text columns for the reports
+    rounded = changes.round(decimals)
+    out = changes.drop(columns=["N", "Error_Abs", "Error_Rel"], errors="ignore").copy()
+    for label in ("future", "ref"):
+        out[f"Mean_{label}"] = (rounded[f"Mean_{label}"].astype(str) + " ± "
+                                + rounded[f"Std_{label}"].astype(str))
+        out = out.drop(columns=f"Std_{label}")
+    for column, error in (("Diff_Abs", "Error_Abs"), ("Diff_Rel", "Error_Rel")):
+        out[column] = rounded[column].astype(str) + " ± " + rounded[error].astype(str)
+    return out
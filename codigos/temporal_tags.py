@@ -0,0 +1,128 @@
+#Clasificacion temporal vectorizada: estacion, año hidrologico, fase ENSO y periodo de megasequia
+#
+# Every tag is a lookup: months index a 13-slot season array, years index an array painted once
+# from the event tables. Works on pandas columns (tag_frame) and xarray time coordinates (tag_time).
+
+import numpy as np
+import pandas as pd
+
+SEASON_LABELS = {
+    'short': ['DJF', 'MAM', 'JJA', 'SON'],
+    'long': ['Verano (DJF)', 'Otoño (MAM)', 'Invierno (JJA)', 'Primavera (SON)'],
+}
+# month -> index in the season labels (slot 0 unused)
+SEASON_OF_MONTH = np.array([-1, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0])
+
+# Periodos ENSO (años, inclusivos). Los intervalos se traslapan en los bordes (1983, 1984, ...):
+# un año que cae en dos eventos toma el primero listado, como en el recorrido original
+ENSO_EVENTS = {
+    "El Niño": [
+        (1982, 1983), (1986, 1988), (1991, 1992), (1994, 1995),
+        (1997, 1998), (2002, 2003), (2004, 2005), (2006, 2007),
+        (2009, 2010), (2014, 2016), (2018, 2019), (2023, 2024)
+    ],
+    "La Niña": [
+        (1983, 1984), (1984, 1985), (1988, 1989), (1995, 1996),
+        (1998, 2001), (2005, 2006), (2007, 2008), (2008, 2009),
+        (2010, 2012), (2016, 2017), (2017, 2018), (2020, 2023)
+    ]
+}
+
+# Periodo previo y megasequia (años, inclusivos)
+MEGADROUGHT_PERIODS = {
+    "1980-2010": (1980, 2009),
+    "2010-2021": (2010, 2021),
+}
+
+
+def season_lookup(seasons):
+    # Month -> season code array of a custom definition {name: [months]}; unlisted months get -1
+    lookup = np.full(13, -1)
+    for code, months in enumerate(seasons.values()):
+        lookup[list(months)] = code
+    return lookup
+
+
+def season_of(month, labels='short'):
+    # Categorical season of each month (1-12). labels: 'short', 'long', a list of four names for
+    # DJF/MAM/JJA/SON, or a custom definition {name: [months]} (months outside it give NaN)
+    if isinstance(labels, dict):
+        names, lookup = list(labels), season_lookup(labels)
+    else:
+        names, lookup = SEASON_LABELS[labels] if isinstance(labels, str) else list(labels), SEASON_OF_MONTH
+    codes = lookup[np.asarray(month, dtype='int64')]
+    return pd.Categorical.from_codes(codes, categories=names, ordered=True)
+
+
+def hydro_year(year, month, start_month=4):
+    # Hydrological year starting in start_month (April in central Chile): Jan-Mar belong to year - 1
+    year, month = np.asarray(year, dtype='int64'), np.asarray(month, dtype='int64')
+    return year - (month < start_month)
+
+
+def _year_lookup(events):
+    # Painted array over the covered years; the first listed event wins on overlaps
+    labels = list(events)
+    first = min(start for periods in events.values() for start, _ in _periods(periods))
+    last = max(end for periods in events.values() for _, end in _periods(periods))
+    lookup = np.full(last - first + 1, -1)
+    for code in reversed(range(len(labels))):
+        for start, end in _periods(events[labels[code]]):
+            lookup[start - first:end - first + 1] = code
+    return lookup, first, labels
+
+
+def _periods(periods):
+    # A label maps to one (start, end) pair or to a list of them
+    return [periods] if np.isscalar(periods[0]) else periods
+
+
+def classify_years(year, events, default=None):
+    # Categorical label of each year from an event table {label: [(start, end), ...]};
+    # years outside every event get `default` (NaN when None); missing years stay NaN
+    lookup, first, labels = _year_lookup(events)
+    year = np.asarray(year, dtype='float64')
+    valid = np.isfinite(year)
+    index = np.where(valid, year, first).astype('int64') - first
+    inside = valid & (index >= 0) & (index < len(lookup))
+    codes = np.where(inside, lookup[np.clip(index, 0, len(lookup) - 1)], -1)
+    categories = labels + ([default] if default is not None else [])
+    if default is not None:
+        codes = np.where((codes == -1) & valid, len(labels), codes)
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def enso_phase(year, events=ENSO_EVENTS, neutral="Neutral"):
+    return classify_years(year, events, default=neutral)
+
+
+def drought_period(year, periods=MEGADROUGHT_PERIODS):
+    return classify_years(year, periods)
+
+
+def tag_frame(df, year="Year", month="Month", season_labels='short', start_month=4,
+              enso_events=ENSO_EVENTS, drought_periods=MEGADROUGHT_PERIODS):
+    # Season, Hydro_Year, ENSO and Period columns in one vectorized pass (missing columns are skipped)
+    df = df.copy()
+    if month in df.columns:
+        df["Season"] = season_of(df[month], season_labels)
+    if year in df.columns:
+        if month in df.columns:
+            df["Hydro_Year"] = hydro_year(df[year], df[month], start_month)
+        df["ENSO"] = enso_phase(df[year], enso_events)
+        df["Period"] = drought_period(df[year], drought_periods)
+    return df
+
+
+def tag_time(data, dim='time', season_labels='short', start_month=4,
+             enso_events=ENSO_EVENTS, drought_periods=MEGADROUGHT_PERIODS):
+    # Same tags as non-dimension coordinates along `dim` (numpy or cftime times), for groupby
+    year, month = data[dim].dt.year.values, data[dim].dt.month.values
+    tags = {
+        'season': season_of(month, season_labels),
+        'hydro_year': hydro_year(year, month, start_month),
+        'enso': enso_phase(year, enso_events),
+        'period': drought_period(year, drought_periods),
+    }
+    return data.assign_coords({name: (dim, np.asarray(values, dtype=object) if isinstance(values, pd.Categorical)
+                                      else values) for name, values in tags.items()})
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los modulos de codigos/ y nc_manipulation/ se importan por nombre, como desde los scripts
+codigos = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(codigos, 'nc_manipulation'))
+sys.path.insert(0, codigos)
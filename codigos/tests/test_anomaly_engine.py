@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from anomaly_engine import compute_anomalies, reader_split
+
+BASINS = ['fid_42', 'fid_48']
+
+
+def write_cube(path, variable, start, years, offset):
+    time = pd.date_range(f'{start}-01-01', periods=12 * years, freq='MS')
+    values = offset + np.arange(time.size)[:, None, None] * 0.01 + np.zeros((1, 2, 3))
+    xr.Dataset({variable: (('time', 'lat', 'lon'), values)},
+               coords={'time': time, 'lat': [-33.0, -33.5], 'lon': [-70.0, -70.5, -71.0]}).to_netcdf(path)
+
+
+def make_inputs(tmp_path):
+    baseline_path, future_path = tmp_path / 'base', tmp_path / 'future'
+    baseline_path.mkdir()
+    future_path.mkdir()
+    for i, basin in enumerate(BASINS):
+        write_cube(baseline_path / f'base_{basin}.nc', 'pr', 1980, 31, 1 + i)
+        for j, ssp in enumerate((126, 585)):
+            write_cube(future_path / f'PR_CHELSA_MODEL{j}_ssp{ssp}_DQM_{basin}.nc', 'pr', 2030, 31, 2 + i + j)
+    settings = {'baseline_file': 'base_{basin}.nc', 'baseline_var': 'pr', 'future_var': 'pr',
+                'future_match': lambda f: f.startswith('PR_'), 'annual': 'sum'}
+    return settings, str(baseline_path), str(future_path)
+
+
+def test_without_store_matches_store(tmp_path):
+    settings, baseline_path, future_path = make_inputs(tmp_path)
+    direct = compute_anomalies(dict(settings, store_folder=None), BASINS, baseline_path, future_path)
+    stored = compute_anomalies(dict(settings, store_folder=str(tmp_path / 'store')), BASINS, baseline_path,
+                               future_path)
+    assert len(direct) == 4
+    pd.testing.assert_frame_equal(direct, stored)
+    # baseline: sum of the monthly values of 1980-2010, averaged over the years
+    months = 1 + np.arange(12 * 31) * 0.01
+    np.testing.assert_allclose(direct['baseline'].iloc[0], months.reshape(31, 12).sum(axis=1).mean())
+
+
+def test_prefetch_matches_serial(tmp_path):
+    settings, baseline_path, future_path = make_inputs(tmp_path)
+    serial = compute_anomalies(settings, BASINS, baseline_path, future_path)
+    prefetched = compute_anomalies(dict(settings, prefetch=2), BASINS, baseline_path, future_path)
+    pd.testing.assert_frame_equal(serial, prefetched)
+
+
+def test_parallel_matches_serial(tmp_path):
+    settings, baseline_path, future_path = make_inputs(tmp_path)
+    serial = compute_anomalies(settings, BASINS, baseline_path, future_path)
+    for extra in ({}, {'prefetch': 2}, {'prefetch': 4, 'max_readers': 4},
+                  {'store_folder': str(tmp_path / 'store')}):
+        parallel = compute_anomalies(dict(settings, n_workers=2, **extra), BASINS, baseline_path, future_path)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+
+def test_reader_split_caps_concurrent_reads():
+    assert reader_split({'n_workers': 8, 'prefetch': 4}) == (8, 4)
+    assert reader_split({'n_workers': 8, 'prefetch': 4, 'max_readers': 4}) == (4, 1)
+    assert reader_split({'n_workers': 2, 'prefetch': 4, 'max_readers': 4}) == (2, 2)
+    assert reader_split({'n_workers': 1, 'prefetch': 8, 'max_readers': 4}) == (1, 4)
+    assert reader_split({'n_workers': 3, 'prefetch': 4, 'max_readers': 4}) == (3, 1)
+    assert reader_split({'n_workers': 4, 'max_readers': 2}) == (2, None)
+
+
+def test_sketch_filter_runs_on_the_cube(tmp_path):
+    settings, baseline_path, future_path = make_inputs(tmp_path)
+    # Un pixel con valores extremos: el filtro por pixel lo saca antes de la media por cuenca
+    path = f'{future_path}/PR_CHELSA_MODEL0_ssp126_DQM_fid_42.nc'
+    with xr.open_dataset(path) as data:
+        cube = data.load()
+    cube['pr'][::7, 0, 0] = 100.0
+    cube.to_netcdf(path)
+
+    settings = dict(settings, remove_outliers=True)
+    sketched = compute_anomalies(dict(settings, outlier_sketch_size=1000), BASINS, baseline_path, future_path)
+    on_series = compute_anomalies(settings, BASINS, baseline_path, future_path)
+
+    # Con k mayor que la serie el sketch es exacto: igual al filtro IQR exacto pixel a pixel
+    pr = cube['pr']
+    quartiles = pr.quantile([0.25, 0.75], dim='time')
+    iqr = quartiles.sel(quantile=0.75) - quartiles.sel(quantile=0.25)
+    kept = pr.where((pr >= quartiles.sel(quantile=0.25) - 1.5 * iqr) & (pr <= quartiles.sel(quantile=0.75) + 1.5 * iqr))
+    annual = kept.mean(dim=('lat', 'lon')).groupby('time.year').sum()
+    expected = float(annual.sel(year=slice(2030, 2060)).mean())
+
+    row = sketched['file'] == 'PR_CHELSA_MODEL0_ssp126_DQM_fid_42.nc'
+    np.testing.assert_allclose(sketched.loc[row, 'future_mean'].iloc[0], expected)
+    assert not np.isclose(on_series.loc[row, 'future_mean'].iloc[0], expected)
+    # Los demas miembros no tienen outliers: mismo resultado con los dos filtros
+    pd.testing.assert_frame_equal(sketched[~row], on_series[~row])
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+from clip_engine import clip_netcdf_all_basins
+
+# fid_1 holds fid_2 (nested gpkgs): both cover the cells of fid_2
+BASINS = {'fid_1': box(-71.9, -34.9, -70.1, -33.1), 'fid_2': box(-71.4, -34.4, -70.6, -33.6)}
+
+
+def make_inputs(tmp_path):
+    lat, lon = np.arange(-35.75, -32.0, 0.25), np.arange(-72.75, -69.0, 0.25)
+    time = pd.date_range('2000-01-01', periods=6, freq='MS')
+    values = np.random.default_rng(0).normal(size=(len(time), len(lat), len(lon)))
+    path = tmp_path / 'source.nc'
+    xr.Dataset({'pr': (('time', 'lat', 'lon'), values)},
+               coords={'time': time, 'lat': lat, 'lon': lon}).to_netcdf(path)
+    shapes = tmp_path / 'cuencas'
+    shapes.mkdir()
+    for name, geometry in BASINS.items():
+        gpd.GeoDataFrame(geometry=[geometry], crs='EPSG:4326').to_file(shapes / f'{name}.gpkg')
+    return path, shapes
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_overlapping_basins_match_per_basin_clip(tmp_path, cached):
+    path, shapes = make_inputs(tmp_path)
+    output = tmp_path / 'out'
+    output.mkdir()
+    clip_netcdf_all_basins(str(path), str(shapes), str(output), 'PR', variable='pr',
+                           mask_cache_folder=str(tmp_path / 'cache') if cached else None)
+
+    source = xr.open_dataset(path)['pr'].rio.set_spatial_dims('lon', 'lat').rio.write_crs('EPSG:4326')
+    for name, geometry in BASINS.items():
+        expected = source.rio.clip([geometry])
+        clipped = xr.open_dataset(output / f'PR_{name}.nc')['pr']
+        np.testing.assert_array_equal(clipped['lat'], expected['lat'])
+        np.testing.assert_array_equal(clipped['lon'], expected['lon'])
+        np.testing.assert_array_equal(clipped.values, expected.values)
@@ -0,0 +1,95 @@
+import os
+import textwrap
+
+from pipeline import dependencies, run_pipeline
+
+# Etapa de prueba: copia (transformada) su entrada a su salida y anota cada ejecucion en runs.txt;
+# falla si existe el archivo fail_<nombre>
+SCRIPT = """
+import os, sys, time
+name, source, target, mode = sys.argv[1:5]
+folder = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(folder, 'runs.txt'), 'a') as f:
+    f.write(f'start {name}\\n')
+if os.path.exists(os.path.join(folder, f'fail_{name}')):
+    sys.exit(1)
+time.sleep(0.5)
+text = open(source).read()
+os.makedirs(os.path.dirname(target), exist_ok=True)
+with open(target, 'w') as f:
+    f.write('constante' if mode == 'const' else text.upper())
+with open(os.path.join(folder, 'runs.txt'), 'a') as f:
+    f.write(f'end {name}\\n')
+"""
+
+
+def make_stages(tmp_path, mode_a='copy', cpus=1):
+    script = tmp_path / 'stage.py'
+    script.write_text(textwrap.dedent(SCRIPT))
+    (tmp_path / 'raw.txt').write_text('dato')
+
+    def stage(name, source, target, mode='copy', inputs=None):
+        return {'name': name, 'script': str(script), 'cpus': cpus,
+                'args': [name, str(tmp_path / source), str(tmp_path / target), mode],
+                'inputs': [str(tmp_path / p) for p in (inputs or [source])],
+                'outputs': [str(tmp_path / target)]}
+
+    # a -> b (lee la carpeta de a) -> c (lee un patron); d es independiente
+    return [stage('c', 'b/out.txt', 'c.txt', inputs=['b/*.txt']),
+            stage('b', 'a/out.txt', 'b/out.txt', inputs=['a']),
+            stage('a', 'raw.txt', 'a/out.txt', mode_a),
+            stage('d', 'raw.txt', 'd.txt')]
+
+
+def runs(tmp_path):
+    path = tmp_path / 'runs.txt'
+    return path.read_text().split('\n')[:-1] if path.exists() else []
+
+
+def test_dependencies_from_outputs_and_inputs(tmp_path):
+    assert dependencies(make_stages(tmp_path)) == {'a': set(), 'b': {'a'}, 'c': {'b'}, 'd': set()}
+
+
+def test_resume_after_failure(tmp_path):
+    stages, state_path = make_stages(tmp_path), str(tmp_path / 'state.json')
+    (tmp_path / 'fail_b').write_text('')
+    assert run_pipeline(stages, state_path, n_workers=2) == {'a': 'done', 'b': 'failed', 'c': 'blocked',
+                                                            'd': 'done'}
+
+    os.remove(tmp_path / 'fail_b')
+    (tmp_path / 'runs.txt').unlink()
+    assert run_pipeline(stages, state_path, n_workers=2) == {'a': 'up to date', 'b': 'done', 'c': 'done',
+                                                            'd': 'up to date'}
+    assert sorted(runs(tmp_path)) == ['end b', 'end c', 'start b', 'start c']
+    assert (tmp_path / 'c.txt').read_text() == 'DATO'
+
+
+def test_unchanged_upstream_output_skips_dependents(tmp_path):
+    stages, state_path = make_stages(tmp_path, mode_a='const'), str(tmp_path / 'state.json')
+    run_pipeline(stages, state_path)
+    (tmp_path / 'runs.txt').unlink()
+
+    # a se vuelve a ejecutar por su entrada, pero su salida no cambia: b y c quedan al dia
+    (tmp_path / 'raw.txt').write_text('otro dato')
+    status = run_pipeline(stages, state_path)
+    assert status == {'a': 'done', 'b': 'up to date', 'c': 'up to date', 'd': 'done'}
+    assert sorted(runs(tmp_path)) == ['end a', 'end d', 'start a', 'start d']
+
+
+def test_stage_error_marks_it_failed(tmp_path):
+    stages, state_path = make_stages(tmp_path), str(tmp_path / 'state.json')
+    # El log de a no se puede abrir: a falla, d se ejecuta igual
+    os.makedirs(tmp_path / 'state_logs' / 'a.log')
+    assert run_pipeline(stages, state_path) == {'a': 'failed', 'b': 'blocked', 'c': 'blocked', 'd': 'done'}
+
+
+def test_pool_stages_run_one_at_a_time(tmp_path):
+    stages, state_path = make_stages(tmp_path, cpus=2), str(tmp_path / 'state.json')
+    run_pipeline(stages, state_path, n_workers=4, cpus=2)
+    lines = runs(tmp_path)
+    # a y d no dependen entre si, pero cada una usa los 2 nucleos: nunca se solapan
+    assert all(lines[i].split()[1] == lines[i + 1].split()[1] for i in range(0, len(lines), 2))
+
+    (tmp_path / 'runs.txt').unlink()
+    run_pipeline(make_stages(tmp_path, cpus=1), str(tmp_path / 'state_1.json'), n_workers=4, cpus=2)
+    assert runs(tmp_path)[:2] in (['start a', 'start d'], ['start d', 'start a'])
@@ -0,0 +1,34 @@
+import os
+import pandas as pd
+
+from runoff_store import update_runoff_store, load_runoff
+
+
+def make_sources(tmp_path):
+    decadal = tmp_path / 'A_Combined.csv'
+    pd.DataFrame({'COD_CUEN': [54, 54], 'Decade': ['1980-2020', '2020-2030'], 'Month': [1, 1],
+                  'Mean': [1.0, 2.0], 'Std': [0.1, 0.2]}).to_csv(decadal, index=False)
+    series = tmp_path / 'B_anual_v2.csv'
+    pd.DataFrame({'COD_CUEN': [57, 57], 'Year': [2000, 2000], 'Month': [1, 2],
+                  'Runoff': [3.0, 4.0]}).to_csv(series, index=False)
+    return {('decadal', 'A'): (str(decadal), 'CR2MET', 'ssp126'),
+            ('series', 'B'): (str(series), 'CHELSA', 'ssp585')}
+
+
+def test_update_reingests_only_changed_csv(tmp_path):
+    sources = make_sources(tmp_path)
+    root = str(tmp_path / 'store')
+    assert sorted(update_runoff_store(root, sources)) == [('decadal', 'A'), ('series', 'B')]
+    assert update_runoff_store(root, sources) == []
+
+    # Mismo contenido con otro mtime: el sha1 no cambia y no se reingiere
+    path = sources[('series', 'B')][0]
+    os.utime(path, ns=(0, 1))
+    assert update_runoff_store(root, sources) == []
+
+    pd.DataFrame({'COD_CUEN': [57], 'Year': [2001], 'Month': [3], 'Runoff': [5.0]}).to_csv(path, index=False)
+    assert update_runoff_store(root, sources) == [('series', 'B')]
+    series = load_runoff(root, columns=['Year', 'Month', 'Runoff'], family='series', source='B')
+    assert series[['Year', 'Month']].values.tolist() == [[2001, 3]]
+    assert series['Runoff'].tolist() == [5.0]
+    assert len(load_runoff(root, family='decadal')) == 2
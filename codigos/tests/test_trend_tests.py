@@ -0,0 +1,60 @@
+import numpy as np
+import pymannkendall as mk
+from trend_tests import mann_kendall
+
+
+def series(n, seed):
+    rng = np.random.default_rng(seed)
+    return 0.002 * np.arange(n) + rng.normal(size=n) + np.round(rng.normal(size=n), 1)
+
+
+def test_short_series_match_pymannkendall():
+    data = np.vstack([series(60, seed) for seed in range(5)])
+    result = mann_kendall(data)
+    for row, x in zip(result.itertuples(), data):
+        expected = mk.original_test(x)
+        assert row.trend == expected.trend and row.s == expected.s
+        np.testing.assert_allclose([row.p, row.z, row.Tau, row.var_s, row.slope, row.intercept],
+                                   [expected.p, expected.z, expected.Tau, expected.var_s, expected.slope,
+                                    expected.intercept], rtol=1e-10, atol=1e-12)
+
+
+def test_long_series_match_pymannkendall():
+    # longer than long_series, with a pair budget below the number of pairs: blocked Sen slope
+    data = np.vstack([series(1500, seed) for seed in range(2)])
+    data[1, 1500 // 2] = data[1, 10]  # even count of pairs in the first, ties in both
+    result = mann_kendall(data, long_series=1000, max_cells=50_000)
+    for row, x in zip(result.itertuples(), data):
+        expected = mk.original_test(x)
+        assert row.trend == expected.trend and row.s == expected.s
+        np.testing.assert_allclose([row.p, row.z, row.Tau, row.var_s, row.slope, row.intercept],
+                                   [expected.p, expected.z, expected.Tau, expected.var_s, expected.slope,
+                                    expected.intercept], rtol=1e-10, atol=1e-12)
+
+
+def test_trend_map_matches_pymannkendall(tmp_path):
+    import pandas as pd
+    import xarray as xr
+    from trend_maps import trend_map, compute_trend_map
+
+    time = pd.date_range('1990-01-01', periods=12 * 20, freq='MS')
+    values = np.stack([np.stack([series(time.size, 10 * i + j) for j in range(3)], axis=-1) for i in range(2)],
+                      axis=-2) + 280
+    values[:, 0, 0] = np.nan  # celda sin datos
+    cube = xr.DataArray(values, coords={'time': time, 'lat': [-33.0, -33.5], 'lon': [-70.0, -70.5, -71.0]},
+                        dims=('time', 'lat', 'lon'), name='tas', attrs={'units': 'K'})
+    cube.to_dataset().to_netcdf(tmp_path / 'tas.nc')
+
+    monthly = trend_map(cube, units='K', tile=1).compute()
+    assert monthly['slope'].attrs['units'] == 'degC per time'
+    annual = compute_trend_map(str(tmp_path / 'tas.nc'), 'tas', str(tmp_path / 'trend.nc'), how='mean', units='K')
+    assert annual['slope'].attrs['units'] == 'degC per year'
+    assert np.isnan(monthly['slope'].values[0, 0]) and monthly['n'].values[0, 0] == 0
+
+    for trends, x in ((monthly, cube - 273.15), (annual, (cube - 273.15).groupby('time.year').mean())):
+        for i, j in ((0, 1), (1, 0), (1, 2)):
+            expected = mk.original_test(x.values[:, i, j])
+            cell = trends.isel(lat=i, lon=j)
+            assert int(cell['trend']) == {'decreasing': -1, 'no trend': 0, 'increasing': 1}[expected.trend]
+            np.testing.assert_allclose([cell['tau'], cell['slope'], cell['p'], cell['z']],
+                                       [expected.Tau, expected.slope, expected.p, expected.z], rtol=1e-9)
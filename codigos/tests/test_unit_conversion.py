@@ -0,0 +1,30 @@
+import numpy as np
+import xarray as xr
+import pytest
+
+from unit_conversion import convert_units
+
+
+def monthly(values, units):
+    time = xr.cftime_range('2030-01', periods=len(values), freq='MS', calendar='noleap')
+    return xr.DataArray(np.asarray(values, dtype='float64'), coords={'time': time}, dims='time',
+                        attrs={'units': units, 'long_name': 'test'})
+
+
+@pytest.mark.parametrize('units, values, expected, target', [
+    ('K', [273.15, 283.15], [0.0, 10.0], 'degC'),
+    ('kg m-2 s-1', [1e-5, 1e-5], [1e-5 * 86400 * 31, 1e-5 * 86400 * 28], 'mm/month'),
+    ('mm/day', [2.0, 2.0], [62.0, 56.0], 'mm/month'),
+])
+def test_conversion_sets_target_units(units, values, expected, target):
+    converted = convert_units(monthly(values, units), units)
+    np.testing.assert_allclose(converted.values, expected)
+    assert converted.attrs == {'units': target, 'long_name': 'test'}
+
+
+@pytest.mark.parametrize('units', ['K', 'kg m-2 s-1', 'mm/day', 'degC'])
+def test_auto_is_idempotent(units):
+    data = monthly([280.0, 1e-5], units)
+    once = convert_units(data, 'auto')
+    twice = convert_units(once, 'auto')
+    xr.testing.assert_identical(once, twice)
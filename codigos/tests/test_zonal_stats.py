@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import geopandas as gpd
+import pytest
+from shapely.geometry import box, Polygon
+
+from zonal_stats import basin_weight_matrix, basin_mean_series
+
+# Cuencas que cortan celdas a medias, una no rectangular
+BASINS = {
+    'fid_1': box(-71.8, -34.6, -70.3, -33.2),
+    'fid_2': Polygon([(-71.3, -34.9), (-70.1, -34.9), (-70.1, -33.4)]),
+}
+
+
+def make_cube():
+    lat = np.arange(-35.75, -32.5, 0.5)
+    lon = np.arange(-72.25, -69.5, 0.5)
+    time = pd.date_range('2000-01-01', periods=4, freq='MS')
+    rng = np.random.default_rng(0)
+    values = rng.normal(10, 3, (len(time), len(lat), len(lon)))
+    values[1, 3, 2] = np.nan  # celda sin dato dentro de fid_1
+    return xr.DataArray(values, coords={'time': time, 'lat': lat, 'lon': lon},
+                        dims=('time', 'lat', 'lon'), name='pr')
+
+
+def explicit_means(cube, geometry):
+    # Media ponderada celda a celda: fraccion de la celda en la cuenca x cos(lat), sin NaN
+    means = []
+    for t in range(cube.sizes['time']):
+        total, weight_sum = 0.0, 0.0
+        for i, lat in enumerate(cube['lat'].values):
+            for j, lon in enumerate(cube['lon'].values):
+                value = cube.values[t, i, j]
+                cell = box(lon - 0.25, lat - 0.25, lon + 0.25, lat + 0.25)
+                weight = cell.intersection(geometry).area / cell.area * np.cos(np.deg2rad(lat))
+                if weight > 0 and np.isfinite(value):
+                    total += weight * value
+                    weight_sum += weight
+        means.append(total / weight_sum)
+    return np.array(means)
+
+
+def test_weight_matrix_matches_explicit_mean():
+    cube = make_cube()
+    weights = basin_weight_matrix(cube['lat'].values, cube['lon'].values, list(BASINS.values()))
+    np.testing.assert_allclose(np.asarray(weights.sum(axis=1)).ravel(), 1)
+    flat = np.nan_to_num(cube.values[0].ravel())
+    for k, geometry in enumerate(BASINS.values()):
+        np.testing.assert_allclose(weights[k] @ flat, explicit_means(cube, geometry)[0])
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_basin_mean_series_matches_explicit_mean(tmp_path, cached):
+    cube = make_cube()
+    for name, geometry in BASINS.items():
+        gpd.GeoDataFrame(geometry=[geometry], crs='EPSG:4326').to_file(tmp_path / f'{name}.gpkg')
+    cache_folder = str(tmp_path / 'weights_cache') if cached else None
+
+    for data in (cube, cube.chunk({'time': 1})):
+        means = basin_mean_series(data, str(tmp_path), list(BASINS), cache_folder=cache_folder).compute()
+        assert means.dims == ('time', 'basin')
+        for name, geometry in BASINS.items():
+            np.testing.assert_allclose(means.sel(basin=name).values, explicit_means(cube, geometry))
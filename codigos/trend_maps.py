@@ -0,0 +1,85 @@
+#Mapas de tendencia por pixel (Mann-Kendall / Sen) de los cubos climaticos recortados
+#
+# The cube is opened lazily in lat/lon tiles with the whole time axis, converted to the working
+# units, optionally reduced to annual values, and each tile goes through trend_tests.mann_kendall
+# as one (pixels x time) array. Tiles run on a dask pool (threads by default), so memory is
+# bounded by n_workers x tile. Output: NetCDF with tau, slope, p, z, trend (-1/0/1) and n per cell.
+# Series longer than long_series steps (e.g. how=None on a daily cube) leave the vectorized path:
+# trend_tests runs them one pixel at a time in Python, which is slow on a full grid; test annual
+# values (how='mean'/'sum') or raise long_series (more memory per tile) instead.
+
+import os
+import warnings
+import dask
+import numpy as np
+import xarray as xr
+from anomaly_engine import annual
+from trend_tests import mann_kendall
+from unit_conversion import convert_units
+
+MAP_FIELDS = ['tau', 'slope', 'p', 'z', 'trend', 'n']
+
+
+def _trend_tile(block, alpha, long_series, max_cells):
+    # (..., time) tile -> one array per field with the tile's spatial shape; cells without data are NaN
+    shape = block.shape[:-1]
+    result = mann_kendall(block.reshape(-1, block.shape[-1]), alpha, long_series, max_cells)
+    result = result.rename(columns={'Tau': 'tau'})
+    result['trend'] = np.where(result['h'], np.sign(result['z']), 0)
+    result.loc[result['n'] == 0, MAP_FIELDS[:-1]] = np.nan
+    return tuple(result[field].to_numpy(dtype='float64').reshape(shape) for field in MAP_FIELDS)
+
+
+def _annual_units(units, how):
+    # Units of the annual values: the sum of monthly totals is a yearly total
+    if how == 'sum' and units.endswith('/month'):
+        return units[:-len('month')] + 'year'
+    return units
+
+
+def trend_map(data_array, how=None, units=None, alpha=0.05, tile=64, long_series=1000, max_cells=4_000_000):
+    # Lazy Dataset of trend fields of a (time, lat, lon) DataArray. how='mean'/'sum' tests annual
+    # values (per year), None the series as is (per time step). units: see unit_conversion
+    data = convert_units(data_array, units)
+    value_units = str(data.attrs.get('units', ''))
+    dim = 'time'
+    if how is not None:
+        data, dim = annual(data, how), 'year'
+        value_units = _annual_units(value_units, how)
+    if data.sizes[dim] > long_series:
+        warnings.warn(f"{data.sizes[dim]} {dim} steps > long_series={long_series}: every pixel goes "
+                      f"through the per-series Python path; use how='mean'/'sum' or a larger long_series")
+    data = data.chunk({dim: -1, 'lat': tile, 'lon': tile})
+    fields = xr.apply_ufunc(
+        _trend_tile, data, input_core_dims=[[dim]], output_core_dims=[[]] * len(MAP_FIELDS),
+        dask='parallelized', output_dtypes=['float64'] * len(MAP_FIELDS),
+        kwargs={'alpha': alpha, 'long_series': long_series, 'max_cells': max_cells})
+    trends = xr.Dataset(dict(zip(MAP_FIELDS, fields)))
+    trends['slope'].attrs.update(long_name="Sen's slope", units=f"{value_units} per {dim}".strip())
+    trends['tau'].attrs['long_name'] = "Mann-Kendall tau"
+    trends['p'].attrs['long_name'] = "Mann-Kendall p-value (two-sided)"
+    trends['trend'].attrs.update(long_name=f"significant trend at alpha={alpha}", flag_values='-1 0 1',
+                                 flag_meanings='decreasing no_trend increasing')
+    trends['n'].attrs['long_name'] = f"valid {dim} steps"
+    trends.attrs.update(source_variable=data_array.name or '', aggregation=how or 'none')
+    return trends
+
+
+def compute_trend_map(path, variable, output_path, how=None, units=None, alpha=0.05, tile=64,
+                      n_workers=None, scheduler='threads', open_kwargs=None, preprocess=None,
+                      long_series=1000, max_cells=4_000_000):
+    # Trend fields of one NetCDF, written to output_path; tiles are computed on n_workers
+    # threads (or processes). Returns the computed Dataset
+    with xr.open_dataset(path, chunks={'lat': tile, 'lon': tile}, **(open_kwargs or {})) as dataset:
+        if preprocess is not None:
+            dataset = preprocess(dataset)
+        trends = trend_map(dataset[variable], how, units, alpha, tile, long_series, max_cells)
+        trends.attrs['source_file'] = os.path.basename(path)
+        (trends,) = dask.compute(trends, scheduler=scheduler, num_workers=n_workers or os.cpu_count())
+    encoding = {field: {'zlib': True, 'complevel': 4, 'dtype': 'float32'} for field in MAP_FIELDS}
+    encoding['trend']['dtype'] = encoding['n']['dtype'] = 'int16'
+    encoding['trend']['_FillValue'] = encoding['n']['_FillValue'] = -9999
+    tmp_path = output_path + '.tmp'
+    trends.to_netcdf(tmp_path, encoding=encoding)
+    os.replace(tmp_path, output_path)
+    return trends
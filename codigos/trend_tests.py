@@ -0,0 +1,138 @@
+#Mann-Kendall y pendiente de Sen vectorizados para muchas series a la vez
+#
+# mann_kendall takes a 2-D array (series x time) and returns, per series, the same fields as
+# pymannkendall.original_test: trend, h, p, z, Tau, s, var_s, slope, intercept (plus n).
+# Missing values are skipped as pymannkendall does: S, var(S) and Tau use the valid values only,
+# the Sen slope uses the pairs of valid values with their original time distance.
+# Series up to `long_series` points use pairwise differences over blocks of series (no Python
+# loop over series or pairs); longer series get S from the O(n log n) Kendall tau of scipy and the
+# Sen slope from a selection over blocks of pairs, so no array of every pair is built.
+
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.stats import kendalltau, norm
+
+TREND_COLUMNS = ['trend', 'h', 'p', 'z', 'Tau', 's', 'var_s', 'slope', 'intercept', 'n']
+
+
+def _tie_term(data):
+    # sum over tied groups of t(t-1)(2t+5), per series (NaN not counted)
+    rows, cols = np.nonzero(~np.isnan(data))
+    if not len(rows):
+        return np.zeros(len(data))
+    values = data[rows, cols]
+    order = np.lexsort((values, rows))
+    rows, values = rows[order], values[order]
+    starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (values[1:] != values[:-1])])
+    t = np.diff(np.r_[starts, len(values)]).astype('float64')
+    return np.bincount(rows[starts], weights=t * (t - 1) * (2 * t + 5), minlength=len(data))
+
+
+def _pairwise(block, first, second, distance):
+    # S and Sen slope of a block of series from the differences of every pair (first < second)
+    diff = block[:, second] - block[:, first]
+    s = np.nansum(np.sign(diff), axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN series
+        slope = np.nanmedian(diff / distance, axis=1)
+    return s, slope
+
+
+def _slope_blocks(t, y, max_cells):
+    # Slopes of every pair (i < j) of a series, yielded in row blocks of about max_cells pairs
+    rows = max(1, max_cells // len(y))
+    for start in range(0, len(y) - 1, rows):
+        stop = min(start + rows, len(y) - 1)
+        diff = y[start + 1:] - y[start:stop, None]
+        distance = t[start + 1:] - t[start:stop, None]
+        upper = np.arange(start + 1, len(y)) > np.arange(start, stop)[:, None]
+        yield diff[upper] / distance[upper]
+
+
+def _sen_slope(t, y, max_cells, sample_size=1_000_000, seed=0):
+    # Exact median of the pairwise slopes in bounded memory: a seeded sample of pairs brackets the
+    # median, one blocked pass counts the slopes below the bracket and keeps those inside it, and
+    # the median is selected among the kept ones (the bracket widens if it missed)
+    n = len(y)
+    n_pairs = n * (n - 1) // 2
+    if n_pairs == 0:
+        return np.nan
+    if n_pairs <= max_cells:
+        return np.median(np.concatenate(list(_slope_blocks(t, y, max_cells))))
+    ranks = np.array([(n_pairs - 1) // 2, n_pairs // 2])
+    rng = np.random.default_rng(seed)
+    i, j = rng.integers(0, n, size=(2, min(sample_size, n_pairs)))
+    i, j = np.minimum(i, j)[i != j], np.maximum(i, j)[i != j]
+    sample = (y[j] - y[i]) / (t[j] - t[i])
+    width = 3 / np.sqrt(len(sample))
+    while True:
+        low, high = np.quantile(sample, [max(0.0, 0.5 - width), min(1.0, 0.5 + width)])
+        if width >= 0.5:
+            low, high = -np.inf, np.inf
+        below, inside = 0, []
+        for slopes in _slope_blocks(t, y, max_cells):
+            below += np.count_nonzero(slopes < low)
+            inside.append(slopes[(slopes >= low) & (slopes <= high)])
+        inside = np.concatenate(inside)
+        if below <= ranks[0] and ranks[1] < below + len(inside):
+            return np.partition(inside, ranks - below)[ranks - below].mean()
+        width *= 4
+
+
+def _long_series(x, max_cells):
+    # S through Kendall's tau-b against time (no ties in time): S = tau * sqrt(n0 * (n0 - ties)),
+    # and the exact Sen slope of one long series
+    valid = ~np.isnan(x)
+    y = x[valid]
+    n = len(y)
+    n0 = n * (n - 1) / 2
+    _, counts = np.unique(y, return_counts=True)
+    ties = (counts * (counts - 1) / 2).sum()
+    tau = kendalltau(np.flatnonzero(valid), y).statistic if n0 > ties else 0.0
+    s = float(np.round(tau * np.sqrt(n0 * (n0 - ties))))
+    return s, _sen_slope(np.flatnonzero(valid).astype('float64'), y, max_cells)
+
+
+def mann_kendall(data, alpha=0.05, long_series=1000, max_cells=20_000_000):
+    # One row per series (index of `data` when it is a DataFrame); 1-D input is a single series
+    index = data.index if isinstance(data, pd.DataFrame) else None
+    data = np.atleast_2d(np.asarray(data, dtype='float64'))
+    n_series, length = data.shape
+    n = (~np.isnan(data)).sum(axis=1)
+
+    s = np.zeros(n_series)
+    slope = np.full(n_series, np.nan)
+    if length <= long_series:
+        first, second = np.triu_indices(length, 1)
+        distance = (second - first).astype('float64')
+        block = max(1, max_cells // max(len(first), 1))
+        for start in range(0, n_series, block):
+            s[start:start + block], slope[start:start + block] = _pairwise(data[start:start + block], first,
+                                                                             second, distance)
+    else:
+        for row in range(n_series):
+            s[row], slope[row] = _long_series(data[row], max_cells)
+
+    var_s = (n * (n - 1) * (2 * n + 5) - _tie_term(data)) / 18
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(s > 0, (s - 1) / np.sqrt(var_s), np.where(s < 0, (s + 1) / np.sqrt(var_s), 0.0))
+        tau = s / (.5 * n * (n - 1))
+    p = 2 * (1 - norm.cdf(np.abs(z)))
+    h = np.abs(z) > norm.ppf(1 - alpha / 2)
+    trend = np.where(h & (z < 0), 'decreasing', np.where(h & (z > 0), 'increasing', 'no trend'))
+
+    # Intercept of the Kendall-Theil line: median(x) - median(valid time indices) * slope
+    times = np.where(np.isnan(data), np.nan, np.arange(length, dtype='float64'))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        intercept = np.nanmedian(data, axis=1) - np.nanmedian(times, axis=1) * slope
+
+    return pd.DataFrame({'trend': trend, 'h': h, 'p': p, 'z': z, 'Tau': tau, 's': s, 'var_s': var_s,
+                         'slope': slope, 'intercept': intercept, 'n': n}, index=index)
+
+
+def mann_kendall_table(df, series, time, value, alpha=0.05, **kwargs):
+    # Long frame -> one series per `series` key(s) along `time` (missing steps are NaN) -> results
+    wide = df.pivot_table(index=series, columns=time, values=value, aggfunc='first', observed=True)
+    return mann_kendall(wide, alpha=alpha, **kwargs).reset_index()
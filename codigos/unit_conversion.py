@@ -0,0 +1,53 @@
+#Conversiones de unidades compartidas por los scripts de anomalias (cualquier calendario CF)
+
+import xarray as xr
+
+SECONDS_PER_DAY = 86400
+
+
+def k_to_c(kelvin):
+    return kelvin - 273.15
+
+
+def days_in_month(time):
+    # Days of each month of a time coordinate; standard, noleap, 360_day... (numpy or cftime)
+    if not isinstance(time, xr.DataArray):
+        time = xr.DataArray(time, dims='time', coords={'time': time})
+    return time.dt.days_in_month
+
+
+def flux_to_monthly_total(data, time_dim='time'):
+    # kg m-2 s-1 (= mm/s) -> mm/month; lazy on chunked data, only the time axis is computed
+    return data * (days_in_month(data[time_dim]) * SECONDS_PER_DAY)
+
+
+def daily_to_monthly_total(data, time_dim='time'):
+    # mm/day -> mm/month
+    return data * days_in_month(data[time_dim])
+
+
+# units attribute -> (conversion, units of the result): the units of the observed products
+CONVERSIONS = {
+    'K': (lambda data, time_dim: k_to_c(data), 'degC'),
+    'kg m-2 s-1': (flux_to_monthly_total, 'mm/month'),
+    'mm/s': (flux_to_monthly_total, 'mm/month'),
+    'mm/day': (daily_to_monthly_total, 'mm/month'),
+    'mm d-1': (daily_to_monthly_total, 'mm/month'),
+}
+
+
+def convert_units(data, units=None, time_dim='time'):
+    # units=None: as is; units='auto': from data.attrs['units'], unknown units are left as is.
+    # The result carries the target units, so 'auto' does not convert twice
+    if units == 'auto':
+        units = data.attrs.get('units')
+        if units not in CONVERSIONS:
+            return data
+    if units is None:
+        return data
+    if units not in CONVERSIONS:
+        raise ValueError(f"No conversion for units '{units}'")
+    conversion, target_units = CONVERSIONS[units]
+    converted = conversion(data, time_dim)
+    converted.attrs = dict(data.attrs, units=target_units)
+    return converted
@@ -0,0 +1,58 @@
+#Estadisticas por ventana de años, reducciones y peak water de series anuales (muchas a la vez)
+#
+# The long frame is pivoted once to a (series x year) array; every window statistic is a nan-
+# reduction over a slice of year columns and the peak water comes from one centered moving
+# average over all series, so the cost does not depend on the number of groups in Python.
+
+import numpy as np
+import pandas as pd
+
+
+def annual_matrix(df, keys, time="Year", value="Runoff_Total"):
+    # (series x year) frame; years missing in a series are NaN
+    return df.pivot_table(index=keys, columns=time, values=value, aggfunc="mean", observed=True)
+
+
+def window_statistics(wide, windows):
+    # Mean, std (ddof=1) and count per series of every window {label: (first_year, last_year)}
+    # (inclusive; None for the whole series), plus mean_all
+    years = wide.columns.to_numpy(dtype="int64")
+    values = wide.to_numpy(dtype="float64")
+    stats = pd.DataFrame(index=wide.index)
+    for label, period in {"all": None, **windows}.items():
+        selected = values if period is None else values[:, (years >= period[0]) & (years <= period[1])]
+        count = (~np.isnan(selected)).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            total = np.nansum(selected, axis=1)
+            mean = np.where(count > 0, total / count, np.nan)
+            squares = np.nansum((selected - mean[:, None]) ** 2, axis=1)
+            std = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+        stats[f"mean_{label}"], stats[f"std_{label}"], stats[f"n_{label}"] = mean, std, count
+    return stats
+
+
+def reduction(stats, initial, final):
+    # Reduction (%) from the initial to the final window and its error,
+    # sqrt(std_initial^2 + std_final^2) / mean_initial * 100
+    reduced = (stats[f"mean_{initial}"] - stats[f"mean_{final}"]) / stats[f"mean_{initial}"] * 100
+    error = np.hypot(stats[f"std_{initial}"], stats[f"std_{final}"]) / stats[f"mean_{initial}"] * 100
+    return reduced, error
+
+
+def peak_water(wide, window=11, min_periods=None):
+    # Peak water per series: year and magnitude of the maximum of the centered `window`-year moving
+    # average, and of the raw series. By default only full windows count, so the half-empty windows
+    # at the ends of the series cannot set the peak; missing years are NaN (the rolling is positional)
+    min_periods = min_periods or window
+    years = wide.columns.to_numpy(dtype="int64")
+    years = np.arange(years.min(), years.max() + 1) if len(years) else years
+    wide = wide.reindex(columns=years)
+    smoothed = wide.T.rolling(window, center=True, min_periods=min_periods).mean().T.to_numpy(dtype="float64")
+    raw = wide.to_numpy(dtype="float64")
+    peaks = pd.DataFrame(index=wide.index)
+    for prefix, values in (("Peak", smoothed), ("Raw_Peak", raw)):
+        has_data = ~np.isnan(values).all(axis=1)
+        position = np.nanargmax(np.where(has_data[:, None], values, 0), axis=1)
+        peaks[f"{prefix}_Year"] = pd.array(np.where(has_data, years[position], np.nan), dtype="Int64")
+        peaks[f"{prefix}_Runoff"] = np.where(has_data, values[np.arange(len(values)), position], np.nan)
+    return peaks